@@ -0,0 +1,272 @@
+"""
+Drive the grading endpoints end to end without a GOOGLE_API_KEY.
+
+The Gemini chat, embedding and vision clients are swapped for the fakes in
+benchmarks/fakes.py, synthetic PDF essays, photos and a rubric are
+generated up front, and the server runs on a local threaded HTTP server.
+Every scenario posts batches to one endpoint from several client threads
+and reports throughput, request latency percentiles and peak RSS.
+
+    python benchmarks/bench_e2e.py --batches 1 10 50 --requests 4 --concurrency 2
+    python benchmarks/bench_e2e.py --endpoints pdf automate --latency 1 --error-rate 0.02
+    python benchmarks/bench_e2e.py --endpoints automate --download-latency 0.5
+"""
+import argparse
+import http.server
+import io
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes
+from benchmarks.synthetic import make_essay_pdf, make_photo, make_rubric_pdf
+
+ENDPOINTS = ("pdf", "mixed", "image", "automate")
+QUESTION = "Write an essay on taking risks in nonfiction writing."
+
+
+class RssSampler:
+    """
+    Track the peak resident set size while a scenario runs. Reads
+    /proc/self/statm where available, otherwise falls back to ru_maxrss,
+    which only ever grows
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def current(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+class Corpus:
+    """
+    Synthetic submissions, generated once and reused across requests
+    """
+
+    def __init__(self, directory, essays, photos, essay_pages, photo_size, seed=0):
+        rng = random.Random(seed)
+        self.directory = directory
+        self.rubric = make_rubric_pdf()
+        self.essays = [make_essay_pdf(rng, pages=essay_pages) for _ in range(essays)]
+        self.photos = [make_photo(rng, *photo_size, lines=20) for _ in range(photos)]
+        self.files = {"rubric.pdf": self.rubric}
+        for i, essay in enumerate(self.essays):
+            self.files[f"essay{i}.pdf"] = essay
+        for i, photo in enumerate(self.photos):
+            self.files[f"photo{i}.jpg"] = photo
+        for name, data in self.files.items():
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+
+    def pdfs(self, count):
+        return [(f"student{i}.pdf", self.essays[i % len(self.essays)]) for i in range(count)]
+
+    def images(self, count):
+        return [(f"student{i}.jpg", self.photos[i % len(self.photos)]) for i in range(count)]
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    delay = 0.0
+
+    def do_GET(self):
+        # Stands in for a slow LMS or file host
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_file_server(directory, delay=0.0):
+    # Serves the corpus to /api/grade/automate through the real downloader
+    QuietHandler.delay = delay
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_app(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def build_request(endpoint, batch, corpus, files_url, options):
+    """
+    Return the path, form fields and files for one request of batch
+    submissions
+    """
+    data = {"question": QUESTION, "no_cache": "1", **options}
+    rubric = [("rubric", ("rubric.pdf", corpus.rubric))]
+    if endpoint == "pdf":
+        return "/api/grade/pdf", data, rubric + [("pdf", item) for item in corpus.pdfs(batch)]
+    if endpoint == "image":
+        return "/api/grade/image", data, [("image", item) for item in corpus.images(batch)]
+    if endpoint == "mixed":
+        images = batch // 2
+        files = [("pdf", item) for item in corpus.pdfs(batch - images)] + [("image", item) for item in corpus.images(images)]
+        return "/api/grade/", data, rubric + files
+    urls = [f"{files_url}/essay{i % len(corpus.essays)}.pdf" for i in range(batch)]
+    data.update({"files": ",".join(urls), "rubric": f"{files_url}/rubric.pdf"})
+    return "/api/grade/automate", data, []
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def run_scenario(session, base_url, endpoint, batch, requests_count, concurrency, corpus, files_url, options):
+    path, data, files = build_request(endpoint, batch, corpus, files_url, options)
+
+    def send(_):
+        started = time.perf_counter()
+        response = session.post(base_url + path, data=data,
+                                files=[(field, (name, io.BytesIO(content))) for field, (name, content) in files])
+        return time.perf_counter() - started, response.status_code
+
+    fakes.backend.reset()
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(send, range(requests_count)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds, status in results if status == 200]
+    return {
+        "endpoint": endpoint,
+        "batch": batch,
+        "requests": requests_count,
+        "failed": sum(1 for _, status in results if status != 200),
+        "throughput": len(latencies) * batch / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "peak_rss": rss.peak / 1e6,
+        "llm_calls": sum(fakes.backend.calls.values()),
+        "llm_errors": sum(fakes.backend.errors.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=4, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=2, help="concurrent client requests")
+    parser.add_argument("--latency", type=float, default=0.5, help="mean fake LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--download-latency", type=float, default=0.0, help="seconds the file server waits per file")
+    parser.add_argument("--essay-pages", type=int, default=3)
+    parser.add_argument("--photo-size", type=int, nargs=2, default=[2016, 1512])
+    parser.add_argument("--structured", action="store_true", help="request JSON grades")
+    parser.add_argument("--pack", action="store_true", help="pack short essays into shared calls")
+    parser.add_argument("--index", action="store_true", help="enable background vector indexing")
+    parser.add_argument("--verbose", action="store_true", help="show the server's own output")
+    args = parser.parse_args()
+
+    report = sys.stdout
+    if not args.verbose:
+        # The server prints token usage per batch, retries and failed calls;
+        # keep the report readable
+        import logging
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        sys.stdout = open(os.devnull, "w")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep every cache and index in the scratch directory, and disable
+        # the response cache so each request really reaches the fakes
+        os.environ.update({
+            "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "benchmark-key"),
+            "LLM_CACHE_DB": "",
+            "RUBRIC_CACHE_DIR": os.path.join(directory, "rubric_cache"),
+            "RESULT_DB": os.path.join(directory, "results.sqlite3"),
+            "VECTOR_INDEX_DIR": os.path.join(directory, "vector_indexes"),
+            "VECTOR_INDEX_ENABLED": "1" if args.index else "",
+            "WARM_UP": "",
+        })
+        fakes.install(args.latency, args.jitter, args.error_rate)
+        import server
+        if not args.verbose:
+            # LangChain re-enables its deprecation warnings when it loads
+            import langchain.chains.question_answering
+            import warnings
+            warnings.filterwarnings("ignore")
+
+        corpus_dir = os.path.join(directory, "corpus")
+        os.makedirs(corpus_dir)
+        print("generating corpus...", file=report, flush=True)
+        corpus = Corpus(corpus_dir, essays=8, photos=4, essay_pages=args.essay_pages, photo_size=args.photo_size)
+
+        file_server, files_url = start_file_server(corpus_dir, args.download_latency)
+        app_server, base_url = start_app(server.app)
+        options = {}
+        if args.structured:
+            options["output"] = "json"
+        if args.pack:
+            options["pack"] = "1"
+
+        import requests
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+        print(f"fake LLM latency {args.latency}s +/- {args.jitter}s, error rate {args.error_rate:.1%}, "
+              f"{args.requests} requests per scenario, {args.concurrency} concurrent", file=report)
+        print(f"{'endpoint':<9} {'batch':>5} {'ok':>4} {'subs/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+              f"{'peak MB':>8} {'llm calls':>9} {'llm err':>7}", file=report)
+        try:
+            for endpoint in args.endpoints:
+                for batch in args.batches:
+                    result = run_scenario(session, base_url, endpoint, batch, args.requests, args.concurrency,
+                                          corpus, files_url, options)
+                    print(f"{endpoint:<9} {batch:>5} {result['requests'] - result['failed']:>4} "
+                          f"{result['throughput']:>8.2f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+                          f"{result['p99']:>7.2f} {result['peak_rss']:>8.0f} {result['llm_calls']:>9} "
+                          f"{result['llm_errors']:>7}", file=report, flush=True)
+        finally:
+            app_server.shutdown()
+            file_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare the old serial get_pdf_text loop with the process-pool PdfExtractor.
+
+    python benchmarks/bench_extract.py --files 40 --pages 12
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader
+
+from benchmarks.synthetic import write_corpus
+from extraction import PdfExtractor
+
+
+def serial_extract(paths):
+    # The original implementation: string concatenation on the request thread
+    text = ""
+    tasks = {}
+    for pdf in paths:
+        pdf_reader = PdfReader(pdf, strict=False)
+        for page in pdf_reader.pages:
+            text += page.extract_text()
+        tasks[pdf] = text
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_corpus(directory, args.files, pages=args.pages)
+        print(f"corpus: {args.files} files x {args.pages} pages")
+
+        started = time.perf_counter()
+        serial = serial_extract(paths)
+        serial_seconds = time.perf_counter() - started
+        print(f"serial:   {serial_seconds:.3f}s")
+
+        extractor = PdfExtractor(workers=args.workers, pages_per_task=args.pages_per_task)
+        extractor.extract(paths[:1] * 2)  # start the pool outside the timed run
+        started = time.perf_counter()
+        results = extractor.extract(paths)
+        pooled_seconds = time.perf_counter() - started
+        extractor.shutdown()
+        print(f"pooled:   {pooled_seconds:.3f}s ({args.workers} workers, {serial_seconds / pooled_seconds:.2f}x)")
+
+        page_seconds = [page.seconds for result in results for page in result.pages]
+        print(f"pages:    {len(page_seconds)} extracted, mean {1000 * sum(page_seconds) / len(page_seconds):.2f}ms/page")
+
+        leaked = sum(len(serial[path]) for path in paths)
+        isolated = sum(len(result.text) for result in results)
+        print(f"chars:    serial {leaked} (text leaks across files), pooled {isolated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compare preparing phone photos for the vision model the old way (full
+resolution decode, re-encoded by the Gemini SDK) with ImageNormalizer.
+Each mode runs in a fresh process so peak RSS is comparable.
+
+    python benchmarks/bench_images.py --images 8 --max-edge 1600
+"""
+import argparse
+import io
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, PngImagePlugin
+
+from benchmarks.synthetic import make_photo
+
+
+def sdk_blob(image):
+    # Mirrors google.generativeai's pil_to_blob, which the old code relied on
+    output = io.BytesIO()
+    if isinstance(image, PngImagePlugin.PngImageFile) or image.mode == "RGBA":
+        image.save(output, format="PNG")
+    else:
+        image.save(output, format="JPEG")
+    return output.getvalue()
+
+
+def run_original(paths, options):
+    decode_seconds = 0.0
+    sent = 0
+    for path in paths:
+        started = time.perf_counter()
+        image = Image.open(path)
+        if image.mode == 'RGBA':
+            image = image.convert('RGB')
+        image.load()
+        decode_seconds += time.perf_counter() - started
+        sent += len(sdk_blob(image))
+    return decode_seconds, sent
+
+
+def run_normalized(paths, options):
+    from images import ImageNormalizer
+
+    normalizer = ImageNormalizer(**options)
+    started = time.perf_counter()
+    results = normalizer.normalize(paths)
+    decode_seconds = time.perf_counter() - started
+    errors = [result.error for result in results if result.error]
+    if errors:
+        raise RuntimeError(errors[0])
+    return decode_seconds, sum(len(result.data) for result in results)
+
+
+def measure(mode, paths, options):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    decode_seconds, sent = (run_original if mode == "original" else run_normalized)(paths, options)
+    total_seconds = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return decode_seconds, total_seconds, sent, (peak - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--png", action="store_true", help="write PNG screenshots instead of JPEG photos")
+    parser.add_argument("--max-edge", type=int, default=1600)
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--grayscale", action="store_true")
+    parser.add_argument("--autocontrast", action="store_true")
+    args = parser.parse_args()
+
+    options = {
+        "workers": args.workers,
+        "max_edge": args.max_edge,
+        "quality": args.quality,
+        "grayscale": args.grayscale,
+        "autocontrast": args.autocontrast,
+    }
+    image_format = "PNG" if args.png else "JPEG"
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.images):
+            path = os.path.join(directory, f"student{i}.{image_format.lower()}")
+            with open(path, "wb") as f:
+                f.write(make_photo(rng, args.width, args.height, format=image_format))
+            paths.append(path)
+        uploaded = sum(os.path.getsize(path) for path in paths)
+        print(f"images:      {args.images} {args.width}x{args.height} {image_format}, "
+              f"{uploaded / 1e6:.1f} MB uploaded")
+
+        for mode in ("original", "normalized"):
+            # A fresh process per mode keeps ru_maxrss from carrying over
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                decode_seconds, total_seconds, sent, peak_mb = executor.submit(measure, mode, paths, options).result()
+            print(f"{mode + ':':<12} {sent / 1e6:6.2f} MB sent, decode {decode_seconds:.2f}s, "
+                  f"total {total_seconds:.2f}s, peak RSS +{peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure the per-request cost of setting up LLM clients and chains: building
+them for every call as the server used to, against looking them up in the
+shared LLMRegistry. No requests are sent to the API.
+
+    python benchmarks/bench_llm_setup.py --iterations 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Construction needs a key but never uses it here; keep the server's
+# caches and warm-up out of the measurement
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+os.environ["LLM_CACHE_DB"] = ""
+os.environ["WARM_UP"] = ""
+
+import server
+
+
+def build_per_request(structured):
+    # What one student cost before: a fresh client, template and chain, and
+    # a fresh vision model for image submissions
+    server.build_conversational_chain(True, structured)
+    generation_config = {"response_mime_type": "application/json"} if structured else None
+    server.get_genai().GenerativeModel(server.VISION_MODEL, generation_config=generation_config)
+
+
+def build_fresh(structured):
+    server.llm_registry.clear()
+    build_per_request(structured)
+
+
+def use_registry(structured):
+    server.get_conversational_chain("rubric", structured)
+    server.get_vision_model(structured)
+
+
+def time_it(fn, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i % 2 == 1)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    # Warm imports and lazy module state so neither side pays for them
+    build_fresh(False)
+    server.preload_llm_clients()
+
+    fresh = time_it(build_fresh, args.iterations)
+    server.preload_llm_clients()
+    cached = time_it(use_registry, args.iterations)
+    print(f"per request, built fresh:  {1e3 * fresh:8.3f} ms")
+    print(f"per request, registry:     {1e3 * cached:8.3f} ms")
+    print(f"saved per 100 students:    {100 * (fresh - cached):8.3f} s")
+    print(f"registry: {server.llm_registry.stats()['entries']} clients and chains")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Time MinHash/LSH near-duplicate detection on a synthetic batch with planted
+copies, against exhaustive pairwise comparison of the same signatures.
+
+    python benchmarks/bench_plagiarism.py --docs 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.synthetic import random_paragraph
+from plagiarism import MinHasher, find_similar_pairs, lsh_candidates
+
+
+def make_batch(rng, docs, copies):
+    texts = [" ".join(random_paragraph(rng, 80) for _ in range(6)) for _ in range(docs)]
+    planted = set()
+    chosen = rng.sample(range(docs), 2 * copies)
+    for source, target in zip(chosen[::2], chosen[1::2]):
+        words = texts[source].split()
+        # Copy the essay and lightly reword about 3% of it
+        for _ in range(len(words) * 3 // 100):
+            words[rng.randrange(len(words))] = rng.choice(words)
+        texts[target] = " ".join(words)
+        planted.add((min(source, target), max(source, target)))
+    return texts, planted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--copies", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--brute-force-limit", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts, planted = make_batch(rng, args.docs, args.copies)
+
+    started = time.perf_counter()
+    signatures = MinHasher().signatures(texts)
+    signature_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    candidates = lsh_candidates(signatures)
+    lsh_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pairs = find_similar_pairs(texts, threshold=args.threshold)
+    total_seconds = time.perf_counter() - started
+
+    found = {(i, j) for i, j, _ in pairs}
+    print(f"docs:        {args.docs} ({args.copies} planted copies)")
+    print(f"signatures:  {signature_seconds:.2f}s ({1e6 * signature_seconds / args.docs:.0f}us/doc)")
+    print(f"lsh:         {lsh_seconds:.2f}s, {len(candidates)} candidate pairs of {args.docs * (args.docs - 1) // 2}")
+    print(f"end to end:  {total_seconds:.2f}s, {len(pairs)} pairs >= {args.threshold}")
+    print(f"recall:      {len(found & planted)}/{len(planted)} planted pairs")
+
+    if args.docs <= args.brute_force_limit:
+        started = time.perf_counter()
+        for i in range(args.docs):
+            np.mean(signatures[i] == signatures[i + 1:], axis=1)
+        print(f"all pairs:   {time.perf_counter() - started:.2f}s comparing signatures exhaustively")
+
+
+if __name__ == "__main__":
+    main()
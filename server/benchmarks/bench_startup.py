@@ -0,0 +1,88 @@
+"""
+Report how long `import server` takes in a fresh interpreter, using
+python -X importtime, and fail when it regresses: when the import takes
+longer than --max-ms or pulls in one of the heavy dependencies that the
+grading stages import lazily.
+
+    python benchmarks/bench_startup.py --runs 5 --max-ms 600
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by the stage that needs them, never at start-up
+LAZY_MODULES = [
+    "langchain",
+    "langchain_core",
+    "langchain_community",
+    "langchain_google_genai",
+    "google.generativeai",
+    "faiss",
+    "numpy",
+    "PyPDF2",
+    "PIL",
+]
+
+
+def import_times(warm_up=False):
+    """
+    Import the server in a new interpreter and return {module: (self_us,
+    cumulative_us)} from its -X importtime report
+    """
+    env = dict(os.environ, WARM_UP="startup" if warm_up else "")
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr[-2000:])
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=600, help="fail if the median import is slower")
+    parser.add_argument("--warm-up", action="store_true", help="also time WARM_UP=startup for comparison")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    totals = [times["server"][1] / 1000 for times in runs]
+    median = statistics.median(totals)
+    print(f"import server: median {median:.0f} ms, min {min(totals):.0f} ms over {args.runs} runs")
+
+    print("slowest imports (cumulative):")
+    last = runs[-1]
+    top_level = [(name, cumulative) for name, (_, cumulative) in last.items() if "." not in name and name != "server"]
+    for name, cumulative in sorted(top_level, key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    if args.warm_up:
+        warm = import_times(warm_up=True)["server"][1] / 1000
+        print(f"import server with WARM_UP=startup: {warm:.0f} ms")
+
+    failures = []
+    eager = sorted(name for name in LAZY_MODULES if any(run.get(name) for run in runs))
+    if eager:
+        failures.append(f"imported at start-up: {', '.join(eager)}")
+    if median > args.max_ms:
+        failures.append(f"median import {median:.0f} ms is over the {args.max_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
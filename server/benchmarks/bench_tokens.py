@@ -0,0 +1,47 @@
+"""
+Compare the essay tokens sent with the old overlapping 10k/1k character
+chunks against sending each essay once, for essays of increasing length,
+and time the local token counter.
+
+    python benchmarks/bench_tokens.py --pages 1 3 10 40
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from benchmarks.synthetic import random_paragraph
+from tokens import count_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 3, 10, 40])
+    parser.add_argument("--essays", type=int, default=30, help="essays per batch")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=1000)
+    print(f"{'pages':>5} {'chars':>8} {'chunks':>6} {'chunked':>9} {'whole':>9} {'saved':>6} {'saved/batch':>12}")
+    for pages in args.pages:
+        essay = "\n\n".join(random_paragraph(rng, 120) for _ in range(4 * pages))
+        chunks = splitter.split_text(essay)
+        chunked = sum(count_tokens(chunk) for chunk in chunks)
+        whole = count_tokens(essay)
+        print(f"{pages:>5} {len(essay):>8} {len(chunks):>6} {chunked:>9} {whole:>9} "
+              f"{100.0 * (chunked - whole) / chunked:>5.1f}% {args.essays * (chunked - whole):>12}")
+
+    text = "\n\n".join(random_paragraph(rng, 120) for _ in range(4000))
+    started = time.perf_counter()
+    count_tokens(text)
+    seconds = time.perf_counter() - started
+    print(f"count_tokens: {len(text) / seconds / 1e6:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
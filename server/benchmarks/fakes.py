@@ -0,0 +1,179 @@
+"""
+Local stand-ins for the Gemini chat, embedding and vision clients, so the
+whole server can be exercised without a GOOGLE_API_KEY. Every fake call
+sleeps for a configurable latency plus jitter and fails at a configurable
+rate, and answers in the shape the real model is prompted for.
+"""
+import json
+import random
+import re
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+
+ESSAY_CRITERIA = [("Thesis", 10), ("Analysis of risk", 15), ("Use of evidence", 15), ("Organization", 5), ("Grammar and style", 5)]
+IMAGE_CRITERIA = [("Mathematical Accuracy", 20), ("Problem-Solving Approach", 20), ("Work Clarity", 10)]
+SUBMISSION_ID_PATTERN = re.compile(r'<submission id="(S\d+)">')
+
+
+class FakeBackend:
+    """
+    Shared latency, jitter and error settings plus call counters for every
+    fake client
+    """
+
+    def __init__(self, latency=0.5, jitter=0.1, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = {}
+        self.errors = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, kind):
+        """
+        Simulate one round trip: sleep, then maybe raise like a 503 would
+        """
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            failed = self._random.random() < self.error_rate
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if failed:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+        time.sleep(delay)
+        if failed:
+            raise RuntimeError(f"fake {kind} backend error: 503 Service Unavailable")
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+
+backend = FakeBackend()
+
+
+def fake_grade(criteria):
+    grade = {"criteria": [], "feedback": "Tighten the argument and cite more evidence."}
+    scored = total = 0
+    for name, points in criteria:
+        score = round(points * (0.6 + 0.4 * backend.random()))
+        grade["criteria"].append({"name": name, "score": score, "total": points, "comment": "Mostly meets the criteria."})
+        scored += score
+        total += points
+    grade["percentage"] = round(100 * scored / total)
+    grade["letter"] = "A" if grade["percentage"] >= 90 else "B" if grade["percentage"] >= 80 else "C"
+    return grade
+
+
+def render_fake_grade(grade):
+    lines = [f"• {item['name']}: {item['score']}/{item['total']}\n  {item['comment']}" for item in grade["criteria"]]
+    lines.append(f"\nTotal Percentage Grade: {grade['percentage']}%\nLetter Grade: {grade['letter']}")
+    lines.append(f"\nFeedback:\n{grade['feedback']}")
+    return "\n".join(lines)
+
+
+class FakeChatModel(SimpleChatModel):
+    """
+    Drop-in for ChatGoogleGenerativeAI in LangChain chains and invoke()
+    """
+
+    model: str = "fake-gemini"
+    temperature: float = 0.3
+
+    @property
+    def _llm_type(self):
+        return "fake-gemini"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Extract the given total points" in prompt:
+            backend.call("rubric")
+            return "\n".join(f"{name}: {points} pts" for name, points in ESSAY_CRITERIA) + "\nTotal: 50 points"
+        if "too long to read in one pass" in prompt:
+            backend.call("notes")
+            return "The argument is clear in this part; evidence is thin in places."
+
+        ids = SUBMISSION_ID_PATTERN.findall(prompt)
+        if ids:
+            backend.call("packed")
+            return json.dumps({"results": [{"id": submission_id, **fake_grade(ESSAY_CRITERIA)} for submission_id in ids]})
+
+        backend.call("grading")
+        grade = fake_grade(ESSAY_CRITERIA)
+        if "Respond with only a JSON object" in prompt:
+            return json.dumps(grade)
+        return render_fake_grade(grade)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Drop-in for GoogleGenerativeAIEmbeddings: deterministic unit vectors
+    seeded by the text
+    """
+
+    def __init__(self, model=None, dimension=768, **kwargs):
+        self.model = model
+        self.dimension = dimension
+
+    def _vector(self, text):
+        rng = random.Random(text)
+        vector = [rng.gauss(0, 1) for _ in range(self.dimension)]
+        norm = sum(value * value for value in vector) ** 0.5
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        backend.call("embedding")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        backend.call("embedding")
+        return self._vector(text)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel's vision calls
+    """
+
+    def __init__(self, model_name, generation_config=None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+
+    def generate_content(self, contents, **kwargs):
+        backend.call("vision")
+        grade = fake_grade(IMAGE_CRITERIA)
+        if self.generation_config.get("response_mime_type") == "application/json":
+            return FakeResponse(json.dumps(grade))
+        return FakeResponse("Student's Solution Analysis:\nThe approach is reasonable.\n\nGrading:\n" + render_fake_grade(grade))
+
+
+def install(latency=0.5, jitter=0.1, error_rate=0.0, seed=0):
+    """
+    Swap the fakes in for the real clients. The server imports them lazily
+    from these modules, so this works before or after importing it, as
+    long as no real client has been built yet
+    """
+    import google.generativeai
+    import langchain_google_genai
+
+    backend.latency = latency
+    backend.jitter = jitter
+    backend.error_rate = error_rate
+    backend._random.seed(seed)
+    langchain_google_genai.ChatGoogleGenerativeAI = FakeChatModel
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = FakeEmbeddings
+    google.generativeai.GenerativeModel = FakeGenerativeModel
+    return backend
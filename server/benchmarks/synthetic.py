@@ -0,0 +1,115 @@
+import random
+
+WORDS = (
+    "the author argues that risk taking in nonfiction writing can persuade an audience "
+    "when the purpose genre and style support the message evidence analysis claim "
+    "perspective controversial readers language vocabulary visual design essay source"
+).split()
+
+
+def random_paragraph(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages, line_width=90):
+    """
+    Build a minimal PDF with one Helvetica text page per string in pages
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+
+    for i, text in enumerate(pages):
+        lines = []
+        for paragraph in text.split("\n"):
+            while len(paragraph) > line_width:
+                cut = paragraph.rfind(" ", 0, line_width)
+                cut = cut if cut > 0 else line_width
+                lines.append(paragraph[:cut])
+                paragraph = paragraph[cut:].lstrip()
+            lines.append(paragraph)
+        body = " ".join(f"({_escape(line)}) '" for line in lines)
+        stream = f"BT /F1 10 Tf 50 760 Td 12 TL {body} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_essay_pdf(rng, pages=3, paragraphs_per_page=4):
+    return make_pdf([
+        "\n".join(random_paragraph(rng) for _ in range(paragraphs_per_page))
+        for _ in range(pages)
+    ])
+
+
+def make_rubric_pdf():
+    return make_pdf([
+        "Project 2 Rubric - Total 50 points\n"
+        "Thesis: 10 pts\nAnalysis of risk: 15 pts\nUse of evidence: 15 pts\n"
+        "Organization: 5 pts\nGrammar and style: 5 pts"
+    ])
+
+
+def write_corpus(directory, count, pages=3, seed=0):
+    """
+    Write count synthetic essay PDFs into directory and return their paths
+    """
+    import os
+
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"student{i}.pdf")
+        with open(path, "wb") as f:
+            f.write(make_essay_pdf(rng, pages=pages))
+        paths.append(path)
+    return paths
+
+
+def make_photo(rng, width=4032, height=3024, lines=30, format="JPEG"):
+    """
+    Build a phone-camera sized photo of a handwritten page: noisy, slightly
+    shaded paper with dark strokes of text. Returns the encoded bytes
+    """
+    import io
+
+    from PIL import Image, ImageDraw, ImageFilter
+
+    paper = Image.effect_noise((width, height), 24).point(lambda value: 170 + value // 4)
+    page = Image.merge("RGB", (paper, paper, paper.point(lambda value: value - 12)))
+    draw = ImageDraw.Draw(page)
+    line_height = height // (lines + 2)
+    for line in range(1, lines + 1):
+        x = width // 12
+        y = line * line_height
+        while x < width - width // 12:
+            word = rng.randint(3, 9) * width // 200
+            points = [(x + step, y + rng.randint(-line_height // 6, line_height // 6))
+                      for step in range(0, word, max(1, width // 400))]
+            draw.line(points, fill=(30, 30, 60), width=max(2, width // 800))
+            x += word + width // 80
+    page = page.filter(ImageFilter.GaussianBlur(1))
+
+    output = io.BytesIO()
+    page.save(output, format=format, quality=92)
+    return output.getvalue()
@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one
+    minute's worth of tokens. A rate of 0 disables the bucket
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_minute / 60.0)
+        self.updated_at = now
+
+    def acquire(self, amount=1):
+        if not self.rate_per_minute:
+            return
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60.0 / self.rate_per_minute
+            time.sleep(wait)
+
+    def try_acquire(self, amount=1):
+        """
+        Take amount only if it is there now, returning whether it was
+        """
+        if not self.rate_per_minute:
+            return True
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+    def refund(self, amount=1):
+        if not self.rate_per_minute:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(float(amount), self.capacity))
+
+
+class RateLimiter:
+    """
+    Shared requests-per-minute and tokens-per-minute limit for LLM calls
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens=0):
+        self.requests.acquire(1)
+        if tokens:
+            self.tokens.acquire(tokens)
+
+    def try_acquire(self, tokens=0):
+        """
+        Take one request and tokens without waiting, or neither if both
+        aren't there now. Returns whether they were taken
+        """
+        if not self.requests.try_acquire(1):
+            return False
+        if tokens and not self.tokens.try_acquire(tokens):
+            self.requests.refund(1)
+            return False
+        return True
+
+
+def map_ordered(executor, fn, items, caller_runs=False):
+    """
+    Run fn over items on the executor and yield the results in submission
+    order. With caller_runs set, an item no worker has started by the time
+    its result is wanted runs on the calling thread instead, so a task
+    already running on the executor can fan out over it without waiting on
+    itself
+    """
+    items = list(items)
+    futures = [executor.submit(fn, item) for item in items]
+    try:
+        for future, item in zip(futures, items):
+            if caller_runs and future.cancel():
+                yield fn(item)
+            else:
+                yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
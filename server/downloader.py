@@ -0,0 +1,104 @@
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 256 * 1024
+
+PDF_MAGIC = b'%PDF-'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+Download = namedtuple('Download', ['url', 'path', 'kind', 'extension', 'size'])
+
+
+class DownloadError(ValueError):
+    pass
+
+
+def sniff_file_type(head, content_type=''):
+    """
+    Work out whether downloaded bytes are a PDF or an image, preferring the
+    magic bytes over the Content-Type header. Returns (kind, extension)
+    """
+    if head.startswith(PDF_MAGIC):
+        return 'pdf', '.pdf'
+    if head.startswith(PNG_MAGIC):
+        return 'image', '.png'
+    if head.startswith(JPEG_MAGIC):
+        return 'image', '.jpg'
+
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type == 'application/pdf':
+        return 'pdf', '.pdf'
+    if content_type == 'image/png':
+        return 'image', '.png'
+    if content_type in ('image/jpeg', 'image/jpg'):
+        return 'image', '.jpg'
+    return None, None
+
+
+class Downloader:
+    """
+    Fetches submission URLs over one pooled keep-alive session, sized for
+    workers threads calling fetch at once.
+
+    Each file gets a connect/read timeout plus an overall deadline, and is
+    aborted once it grows past max_bytes.
+    """
+
+    def __init__(self, workers=8, timeout=30, max_bytes=25 * 1024 * 1024, chunk_size=CHUNK_SIZE):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url):
+        deadline = time.monotonic() + self.timeout
+        temp_path = None
+        try:
+            with self.session.get(url, stream=True, timeout=(min(self.timeout, 10), self.timeout)) as response:
+                if response.status_code != 200:
+                    raise DownloadError(f'Failed to download file from {url}')
+
+                length = response.headers.get('Content-Length')
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise DownloadError(f'File from {url} is larger than {self.max_bytes} bytes')
+
+                size = 0
+                kind = extension = None
+                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+                    temp_path = temp_file.name
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if not chunk:
+                            continue
+                        if size == 0:
+                            kind, extension = sniff_file_type(chunk[:16], response.headers.get('Content-Type'))
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise DownloadError(f'File from {url} is larger than {self.max_bytes} bytes')
+                        if time.monotonic() > deadline:
+                            raise DownloadError(f'Timed out downloading file from {url}')
+                        temp_file.write(chunk)
+
+            return Download(url, temp_path, kind, extension, size)
+        except requests.RequestException as e:
+            self._discard(temp_path)
+            raise DownloadError(f'Failed to download file from {url}: {str(e)}')
+        except Exception:
+            self._discard(temp_path)
+            raise
+
+    @staticmethod
+    def _discard(path):
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,159 @@
+import csv
+import io
+
+# One row per student per criteria; a result without criteria (a failed
+# call, or a response nothing could be parsed from) gets a single row
+# with the criteria columns empty
+EXPORT_COLUMNS = [
+    'course_id', 'assignment_id', 'batch_id', 'result_id', 'student', 'criteria', 'scored', 'total', 'comment',
+    'percentage_grade', 'letter_grade', 'rubric_version', 'error', 'created_at',
+]
+NUMERIC_COLUMNS = {'scored', 'total', 'percentage_grade', 'created_at'}
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # Whole scores stay whole in CSV
+    return int(number) if number.is_integer() else number
+
+
+def grade_rows(results):
+    """
+    Flatten stored results into export rows (tuples in EXPORT_COLUMNS
+    order), lazily, one result at a time
+    """
+    for result in results:
+        student = (result.get('course_id'), result.get('assignment_id'), result.get('batch_id'), result.get('id'),
+                   result.get('name'))
+        grade = (_number(result.get('percentage_grade')), result.get('letter_grade') or None,
+                 result.get('rubric_version'), result.get('error'), _number(result.get('created_at')))
+        criteria = result.get('criteria') or [{}]
+        for item in criteria:
+            yield student + (item.get('criteria'), _number(item.get('scored')), _number(item.get('total')),
+                             item.get('comment')) + grade
+
+
+def _chunks(rows, chunk_rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_chunks(rows, chunk_rows=1000):
+    """
+    Encode rows as CSV with a header, yielding the bytes of every
+    chunk_rows rows as soon as they are written
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in _chunks(rows, chunk_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what pyarrow writes until it is drained.
+    tell() keeps counting across drains, which Parquet needs for the
+    offsets in its footer
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet and Arrow exports need pyarrow installed (pip install pyarrow)')
+    return pyarrow
+
+
+def arrow_schema():
+    pa = _import_pyarrow()
+    return pa.schema([(column, pa.float64() if column in NUMERIC_COLUMNS else pa.string())
+                      for column in EXPORT_COLUMNS])
+
+
+def arrow_chunks(rows, export_format='parquet', chunk_rows=10000):
+    """
+    Encode rows as a Parquet file, one row group per chunk_rows rows, or
+    an Arrow IPC stream, one record batch per chunk_rows rows, yielding
+    the bytes of each as soon as it is written. Raises RuntimeError
+    without pyarrow
+    """
+    pa = _import_pyarrow()
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    if export_format == 'parquet':
+        writer = pa.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for chunk in _chunks(rows, chunk_rows):
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(results, export_format='csv', chunk_rows=None):
+    """
+    Stream results as export_format ('csv', 'parquet' or 'arrow'),
+    yielding bytes. Raises ValueError for an unknown format and
+    RuntimeError for a binary one without pyarrow, before anything is
+    written
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    rows = grade_rows(results)
+    if export_format == 'csv':
+        return csv_chunks(rows, chunk_rows or 1000)
+    _import_pyarrow()
+    return arrow_chunks(rows, export_format, chunk_rows or 10000)
@@ -0,0 +1,129 @@
+import io
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+PageResult = namedtuple('PageResult', ['page', 'text', 'seconds'])
+PdfResult = namedtuple('PdfResult', ['source', 'text', 'pages', 'seconds', 'error'])
+
+
+def _open_reader(source):
+    # Imported here so the server only loads PyPDF2 once it reads a PDF
+    from PyPDF2 import PdfReader
+
+    # Sources are file paths or the raw bytes of an uploaded PDF
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return PdfReader(source, strict=False)  # strict=False to be more lenient with malformed PDFs
+
+
+def count_pages(source):
+    return len(_open_reader(source).pages)
+
+
+def extract_pages(source, start=0, stop=None):
+    """
+    Extract the text of pages [start, stop) from one PDF
+    """
+    reader = _open_reader(source)
+    pages = reader.pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    results = []
+    for number in range(start, stop):
+        started = time.perf_counter()
+        text = pages[number].extract_text() or ""
+        results.append(PageResult(number, text, time.perf_counter() - started))
+    return results
+
+
+class PdfExtractor:
+    """
+    Extracts text from many PDFs across a process pool.
+
+    Each PDF is split into tasks of pages_per_task pages so one large file
+    is spread over several workers. Batches of at least inline_pages pages
+    go to the pool even when they are a single task, which keeps the
+    parsing off the server's GIL. Smaller batches are extracted in-process,
+    where the pool start-up and pickling would cost more than they save,
+    as are all batches when workers is 0 or 1. Several threads can extract
+    at once; they share one pool.
+    """
+
+    def __init__(self, workers=None, pages_per_task=16, inline_pages=8):
+        self.workers = multiprocessing.cpu_count() if workers is None else workers
+        self.pages_per_task = pages_per_task
+        self.inline_pages = inline_pages
+        self.last_batch_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is not None:
+                return self._executor
+            # Workers start from a clean process rather than a fork of the
+            # server's threads and locks. A fork server that has only
+            # imported this module is cheaper to start them from than spawn
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def extract(self, sources):
+        """
+        Return a PdfResult for every source, in the same order
+        """
+        started = time.perf_counter()
+        counts = []
+        errors = {}
+        for index, source in enumerate(sources):
+            try:
+                counts.append(count_pages(source))
+            except Exception as e:
+                counts.append(0)
+                errors[index] = e
+
+        tasks = []
+        for index, (source, count) in enumerate(zip(sources, counts)):
+            for start in range(0, count, self.pages_per_task):
+                tasks.append((index, source, start, start + self.pages_per_task))
+
+        pages = [[] for _ in sources]
+        if self.workers > 1 and sum(counts) >= self.inline_pages:
+            futures = [(index, self._pool().submit(extract_pages, source, start, stop)) for index, source, start, stop in tasks]
+            for index, future in futures:
+                try:
+                    pages[index].extend(future.result())
+                except Exception as e:
+                    errors.setdefault(index, e)
+        else:
+            for index, source, start, stop in tasks:
+                try:
+                    pages[index].extend(extract_pages(source, start, stop))
+                except Exception as e:
+                    errors.setdefault(index, e)
+
+        results = []
+        for index, source in enumerate(sources):
+            if index in errors:
+                results.append(PdfResult(source, "", [], 0.0, str(errors[index])))
+                continue
+            page_results = sorted(pages[index], key=lambda page: page.page)
+            text = "".join(page.text for page in page_results)
+            seconds = sum(page.seconds for page in page_results)
+            results.append(PdfResult(source, text, page_results, seconds, None))
+
+        with self._lock:
+            self.last_batch_seconds = time.perf_counter() - started
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
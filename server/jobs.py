@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, total, meta=None):
+        self.id = uuid.uuid4().hex
+        self.meta = meta or {}
+        self.status = 'queued'
+        self.total = total
+        self.completed = 0
+        self.results = []
+        self.error = None
+        self.output = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            **self.meta,
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'completed': self.completed,
+            'progress': round(100.0 * self.completed / self.total, 1) if self.total else 0,
+            'results': list(self.results),
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs grading batches in the background and tracks their progress.
+
+    The job function is called as fn(*args, on_result=callback, **kwargs)
+    and reports each graded submission through callback(name, response,
+    files, result). With workers=0 jobs run inline on the submitting
+    thread, which keeps the whole flow in-process for local testing.
+    """
+
+    def __init__(self, workers=2, max_jobs=1000):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='grading-job') if workers > 0 else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, total=0, meta=None, **kwargs):
+        job = Job(total, meta)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+
+        if self._executor:
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        else:
+            self._run(job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        # Drop the oldest finished jobs once we hold more than max_jobs
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].status in ('done', 'failed'):
+                del self._jobs[job_id]
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        job.started_at = time.time()
+
+        def on_result(name, response, files=1, result=None):
+            entry = {'name': name, 'response': response}
+            if result:
+                entry.update({
+                    'result_id': result['id'],
+                    'percentage_grade': result['percentage_grade'],
+                    'letter_grade': result['letter_grade']
+                })
+            with self._lock:
+                job.results.append(entry)
+                job.completed = min(job.completed + files, job.total) if job.total else job.completed + files
+
+        try:
+            job.output = fn(*args, on_result=on_result, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            print(f"Grading job {job.id} failed: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
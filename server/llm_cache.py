@@ -0,0 +1,131 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    SQLite cache of LLM responses for re-grades and retries.
+
+    Keys are a hash of everything that determines the response (model,
+    prompt version, rubric, question and the submission itself). Entries
+    expire after ttl seconds and the least recently used ones are evicted
+    once the stored responses exceed max_bytes. The stored size is kept
+    as a running total, counted once at startup, so a put never has to
+    scan the table.
+    """
+
+    # Least recently used entries deleted per eviction round
+    EVICT_BATCH = 32
+
+    def __init__(self, db_path, ttl=30 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._connect().execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self._connect().execute('CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at)')
+        self._total = self._connect().execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            if part is None:
+                part = b''
+            elif isinstance(part, str):
+                part = part.encode('utf-8')
+            # Length prefix so ("ab", "c") and ("a", "bc") hash differently
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key):
+        connection = self._connect()
+        row = connection.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            deleted = connection.execute('DELETE FROM responses WHERE key = ? RETURNING size', (key,)).fetchall() \
+                if row is not None else []
+            with self._lock:
+                self.misses += 1
+                self._total -= sum(size for size, in deleted)
+            return None
+        connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        connection = self._connect()
+        replaced = connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+            (key, value, size, now, now)
+        )
+        with self._lock:
+            self._total += size - (replaced[0] if replaced else 0)
+        self._evict(connection, now)
+
+    def _delete(self, connection, query, params):
+        sizes = [size for size, in connection.execute(query + ' RETURNING size', params).fetchall()]
+        with self._lock:
+            self._total -= sum(sizes)
+        return len(sizes)
+
+    def _evict(self, connection, now):
+        if self.ttl:
+            self._delete(connection, 'DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+        evicted = 0
+        while self._total > self.max_bytes:
+            deleted = self._delete(
+                connection,
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)',
+                (self.EVICT_BATCH,)
+            )
+            if not deleted:
+                break
+            evicted += deleted
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self):
+        entries, total = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        with self._lock:
+            # Picks up what other processes sharing the file have written
+            self._total = total
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
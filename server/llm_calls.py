@@ -0,0 +1,168 @@
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Exception class names (anywhere in the MRO) worth another attempt: network
+# trouble, timeouts and google.api_core's 429/500/503/504 errors
+RETRYABLE_ERRORS = {
+    'TimeoutError', 'ConnectionError', 'DeadlineExceeded', 'ResourceExhausted', 'TooManyRequests',
+    'ServiceUnavailable', 'InternalServerError', 'BadGateway', 'GatewayTimeout',
+}
+# Errors re-raised by wrappers often only keep the status in the message
+RETRYABLE_PATTERN = re.compile(r'\b(?:429|500|502|503|504)\b|rate limit|unavailable|overloaded|timed out', re.IGNORECASE)
+
+
+class CallTimeout(TimeoutError):
+    pass
+
+
+def is_retryable(error):
+    if any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__):
+        return True
+    return bool(RETRYABLE_PATTERN.search(str(error)))
+
+
+class CallPolicy:
+    """
+    Deadlines, retries and hedging for blocking LLM calls.
+
+    Each attempt runs on the policy's own pool of workers threads, so the
+    caller can stop waiting after deadline seconds, counted from when the
+    attempt starts running rather than from when it was queued. The
+    abandoned attempt finishes in the background and its result is
+    dropped, so the client should time its requests out as well. An
+    attempt still waiting for a thread after deadline seconds fails
+    without being sent. Retryable errors are retried up to retries times
+    with full-jitter exponential backoff. With
+    hedge_quantile set, a duplicate request is sent once an attempt has
+    taken longer than that quantile of the recent latencies of its kind,
+    and whichever answers first wins.
+
+    With a limiter (a RateLimiter), every attempt takes a request and its
+    tokens from it before it starts, so retries count against the rate
+    limit too, and a hedge is only sent when the limit has room for it
+    right away.
+    """
+
+    def __init__(self, deadline=120, retries=2, backoff=1.0, max_backoff=20, hedge_quantile=0,
+                 hedge_min_samples=20, window=200, workers=32, limiter=None):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.window = window
+        self.limiter = limiter
+        self._latencies = {}
+        self._counts = {'calls': 0, 'retries': 0, 'timeouts': 0, 'hedges': 0, 'hedge_wins': 0, 'hedges_throttled': 0}
+        self._lock = threading.Lock()
+        # Without a deadline or hedging, attempts run on the caller's thread
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-call') \
+            if deadline or hedge_quantile else None
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def hedge_delay(self, kind):
+        """
+        Seconds to wait before hedging a call of this kind, or None until
+        enough latencies have been seen
+        """
+        if not self.hedge_quantile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(self.hedge_quantile * len(samples)))]
+
+    def _timed(self, kind, fn, args, kwargs):
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        with self._lock:
+            latencies = self._latencies.get(kind)
+            if latencies is None:
+                latencies = self._latencies[kind] = deque(maxlen=self.window)
+            latencies.append(time.monotonic() - started)
+        return result
+
+    def _started(self, event, kind, fn, args, kwargs):
+        event.set()
+        return self._timed(kind, fn, args, kwargs)
+
+    def _attempt(self, kind, fn, args, kwargs, tokens):
+        # Waiting on the rate limit doesn't count against the deadline either
+        if self.limiter:
+            self.limiter.acquire(tokens)
+        if self._executor is None:
+            return self._timed(kind, fn, args, kwargs)
+
+        event = threading.Event()
+        first = self._executor.submit(self._started, event, kind, fn, args, kwargs)
+        # Time spent waiting for a free thread doesn't count against the deadline
+        if not event.wait(self.deadline or None) and first.cancel():
+            self._count('timeouts')
+            raise CallTimeout(f"{kind} call could not start within {self.deadline}s, all call threads are busy")
+
+        started = time.monotonic()
+        deadline_at = started + self.deadline if self.deadline else None
+        hedge_delay = self.hedge_delay(kind)
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        pending = {first}
+        hedge = None
+        error = None
+        while pending:
+            now = time.monotonic()
+            wake_at = [at for at in (deadline_at, hedge_at) if at is not None]
+            timeout = max(0.0, min(wake_at) - now) if wake_at else None
+            done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+
+            now = time.monotonic()
+            if pending and deadline_at is not None and now >= deadline_at:
+                self._count('timeouts')
+                raise CallTimeout(f"{kind} call did not finish within {self.deadline}s")
+            if pending and hedge_at is not None and now >= hedge_at:
+                # One duplicate at most; the original keeps running too
+                hedge_at = None
+                if self.limiter and not self.limiter.try_acquire(tokens):
+                    self._count('hedges_throttled')
+                    continue
+                self._count('hedges')
+                hedge = self._executor.submit(self._timed, kind, fn, args, kwargs)
+                pending.add(hedge)
+        raise error
+
+    def call(self, kind, fn, *args, tokens=0, **kwargs):
+        """
+        Call fn(*args, **kwargs) under the policy and return its result,
+        raising the last error once the attempts run out. Each attempt
+        costs tokens against the limiter
+        """
+        self._count('calls')
+        for attempt in range(self.retries + 1):
+            try:
+                return self._attempt(kind, fn, args, kwargs, tokens)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                print(f"Retrying {kind} call in {delay:.1f}s after error: {str(e)}")
+                self._count('retries')
+                time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+        stats['hedge_after'] = {kind: self.hedge_delay(kind) for kind in list(self._latencies)}
+        return stats
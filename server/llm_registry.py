@@ -0,0 +1,42 @@
+import threading
+
+
+class LLMRegistry:
+    """
+    Process-wide cache of LLM clients and chains.
+
+    Building a client sets up its transport and building a chain parses its
+    prompt template, so both are done once per key (model name and prompt
+    variant) and then shared by every request and worker thread.
+    """
+
+    def __init__(self):
+        self.builds = 0
+        self._items = {}
+        # Reentrant because building a chain looks up its client
+        self._lock = threading.RLock()
+
+    def get(self, key, build):
+        item = self._items.get(key)
+        if item is not None:
+            return item
+        with self._lock:
+            # Another thread may have built it while we waited
+            item = self._items.get(key)
+            if item is None:
+                item = build()
+                self._items[key] = item
+                self.builds += 1
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'builds': self.builds,
+                'keys': [':'.join(str(part) for part in key) for key in self._items],
+            }
@@ -0,0 +1,159 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import nullcontext
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Handed out when metrics are disabled so timing a stage costs one call
+NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimate the q quantile by interpolating inside its bucket, the way
+        Prometheus' histogram_quantile does
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class _Timer:
+    def __init__(self, metrics, stage, kind=None):
+        self.metrics = metrics
+        self.stage = stage
+        self.kind = kind
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        if self.kind:
+            self.metrics.count_call(self.kind, error=exc_type is not None)
+        return False
+
+
+class Metrics:
+    """
+    Per-stage latency histograms and LLM call counters, rendered in the
+    Prometheus text format.
+
+    When disabled, time() and llm_call() return a shared no-op context
+    manager, timed() leaves functions undecorated and nothing is recorded,
+    so instrumented code pays almost nothing for it.
+    """
+
+    def __init__(self, enabled=False, prefix='gradify', buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = buckets
+        self._stages = {}
+        self._calls = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def time(self, stage):
+        return _Timer(self, stage) if self.enabled else NULL_TIMER
+
+    def timed(self, stage):
+        """
+        Decorator timing every call of a function under stage. A disabled
+        instance returns the function itself
+        """
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def llm_call(self, kind):
+        """
+        Time one LLM call under the 'llm_<kind>' stage and count it, as an
+        error if the block raises
+        """
+        return _Timer(self, f'llm_{kind}', kind) if self.enabled else NULL_TIMER
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count_call(self, kind, error=False):
+        with self._lock:
+            self._calls[kind] = self._calls.get(kind, 0) + 1
+            if error:
+                self._errors[kind] = self._errors.get(kind, 0) + 1
+
+    def render(self):
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            stages = sorted(self._stages.items())
+            calls = sorted(self._calls.items())
+            errors = dict(self._errors)
+
+            lines.append(f'# HELP {prefix}_stage_seconds Time spent in each grading stage')
+            lines.append(f'# TYPE {prefix}_stage_seconds histogram')
+            for stage, histogram in stages:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines.append(f'# HELP {prefix}_stage_quantile_seconds Estimated p50/p95/p99 of each stage')
+            lines.append(f'# TYPE {prefix}_stage_quantile_seconds gauge')
+            for stage, histogram in stages:
+                for q in QUANTILES:
+                    lines.append(f'{prefix}_stage_quantile_seconds{{stage="{stage}",quantile="{q}"}} {histogram.quantile(q):.6f}')
+
+            lines.append(f'# HELP {prefix}_llm_calls_total LLM calls by kind')
+            lines.append(f'# TYPE {prefix}_llm_calls_total counter')
+            for kind, count in calls:
+                lines.append(f'{prefix}_llm_calls_total{{kind="{kind}"}} {count}')
+
+            lines.append(f'# HELP {prefix}_llm_errors_total Failed LLM calls by kind')
+            lines.append(f'# TYPE {prefix}_llm_errors_total counter')
+            for kind, _ in calls:
+                lines.append(f'{prefix}_llm_errors_total{{kind="{kind}"}} {errors.get(kind, 0)}')
+
+            lines.append(f'# HELP {prefix}_llm_error_ratio Share of LLM calls that failed, by kind')
+            lines.append(f'# TYPE {prefix}_llm_error_ratio gauge')
+            for kind, count in calls:
+                lines.append(f'{prefix}_llm_error_ratio{{kind="{kind}"}} {errors.get(kind, 0) / count:.6f}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,81 @@
+import json
+
+from structured_output import load_json_response, validate_grade
+
+PACKED_FORMAT_INSTRUCTIONS = """
+Grade every submission independently; never let one student's work affect another's grade.
+Respond with only a JSON object, no markdown and no other text, in exactly this shape, with one entry per submission in the order given:
+{"results": [{"id": "<submission id>", "criteria": [{"name": "<criteria name>", "score": <points given>, "total": <points possible>, "comment": "<one short sentence>"}],
+ "feedback": "<2-3 sentences on how to improve>", "percentage": <total percentage grade 0-100>, "letter": "<letter grade, e.g. B+>"}]}
+"""
+
+
+def pack_submissions(sizes, budget, max_items, max_item_tokens):
+    """
+    Split submissions into consecutive packs to grade in one call each.
+
+    sizes are the estimated tokens of each submission. A pack holds at most
+    max_items submissions totalling at most budget tokens; submissions
+    larger than max_item_tokens are always graded on their own. Packs are
+    contiguous so results can be yielded in the original order. Returns a
+    list of index lists
+    """
+    packs = []
+    current = []
+    current_tokens = 0
+    for index, size in enumerate(sizes):
+        if size > max_item_tokens:
+            if current:
+                packs.append(current)
+            packs.append([index])
+            current, current_tokens = [], 0
+            continue
+        if current and (len(current) >= max_items or current_tokens + size > budget):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+def format_packed_submissions(texts):
+    """
+    Label each submission with an id the model echoes back. Returns the ids
+    and the delimited submissions to put in the prompt
+    """
+    ids = [f"S{number}" for number in range(1, len(texts) + 1)]
+    blocks = [f'<submission id="{submission_id}">\n{text.strip()}\n</submission>' for submission_id, text in zip(ids, texts)]
+    return ids, "\n\n".join(blocks)
+
+
+def parse_packed_grades(output_text, ids):
+    """
+    Parse a packed grading response into one validated grade per id, in
+    the order of ids. Raises ValueError if any submission is missing,
+    duplicated or invalid, so the caller can fall back to grading them one
+    at a time
+    """
+    data = load_json_response(output_text)
+    results = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(results, list):
+        raise ValueError('results must be a list')
+
+    grades = {}
+    for item in results:
+        if not isinstance(item, dict) or item.get('id') not in ids:
+            raise ValueError(f"unexpected submission id: {item.get('id') if isinstance(item, dict) else item}")
+        if item['id'] in grades:
+            raise ValueError(f"duplicate submission id: {item['id']}")
+        grades[item['id']] = validate_grade(item)
+
+    missing = [submission_id for submission_id in ids if submission_id not in grades]
+    if missing:
+        raise ValueError(f"missing grades for {', '.join(missing)}")
+    return [grades[submission_id] for submission_id in ids]
+
+
+def dump_grade(grade):
+    # Structured mode stores each packed grade as its own JSON response
+    return json.dumps({key: grade[key] for key in ('criteria', 'feedback', 'percentage', 'letter')})
@@ -0,0 +1,179 @@
+import queue
+import threading
+from contextlib import closing
+
+# Put on a stage's queue once per worker when there is no more input
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: fn applied by a group of worker threads.
+
+    fn takes and returns one item, or with batch_size set takes a list of
+    up to batch_size items that were already waiting on the queue and
+    returns their results in the same order. Items for which when(item) is
+    false pass through untouched.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=None, when=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.when = when
+
+
+class _Item:
+    __slots__ = ('index', 'value', 'error')
+
+    def __init__(self, index, value):
+        self.index = index
+        self.value = value
+        self.error = None
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each a group of worker threads
+    reading from a bounded queue and writing to the next stage's.
+
+    Stages overlap: while one item is being graded the next is extracted
+    and the one after that downloaded. A full queue blocks the stage
+    feeding it, so a saturated stage slows everything upstream instead of
+    piling up work in memory. A stage error is recorded on its item,
+    which skips the remaining stages.
+    """
+
+    def __init__(self, stages, queue_size=8, name='pipeline'):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.name = name
+
+    def run(self, items):
+        """
+        Yield each item's final value in input order, raising the error of
+        a failed item in its place. Closing the generator early stops the
+        pipeline and waits for the items in progress to finish
+        """
+        waiting = {}
+        next_index = 0
+        with closing(self._finished(items)) as finished:
+            for item in finished:
+                waiting[item.index] = item
+                while next_index in waiting:
+                    item = waiting.pop(next_index)
+                    next_index += 1
+                    if item.error is not None:
+                        raise item.error
+                    yield item.value
+
+    def as_completed(self, items):
+        """
+        Like run, but yield (index, value) for each item as soon as it
+        leaves the last stage, so a quick item never waits behind a slow
+        one ahead of it. index is the item's position in items
+        """
+        with closing(self._finished(items)) as finished:
+            for item in finished:
+                if item.error is not None:
+                    raise item.error
+                yield item.index, item.value
+
+    def _finished(self, items):
+        # Start the stages and yield every _Item as it comes out of the last
+        stopped = threading.Event()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        # The results queue is unbounded so the workers never wait on the
+        # reader
+        queues.append(queue.Queue())
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stopped),
+                                    name=f'{self.name}-feed', daemon=True)]
+        for position, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for number in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[position], queues[position + 1], stopped, remaining, lock),
+                    name=f'{self.name}-{stage.name}-{number}', daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def _feed(self, items, output, stopped):
+        try:
+            for index, value in enumerate(items):
+                if stopped.is_set():
+                    break
+                output.put(_Item(index, value))
+        finally:
+            for _ in range(self.stages[0].workers if self.stages else 1):
+                output.put(_DONE)
+
+    def _work(self, stage, input, output, stopped, remaining, lock):
+        try:
+            done = False
+            while not done:
+                batch = [input.get()]
+                if batch[0] is _DONE:
+                    break
+                # Take whatever else is already waiting, without blocking
+                while len(batch) < (stage.batch_size or 1):
+                    try:
+                        item = input.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+
+                if not stopped.is_set():
+                    self._apply(stage, batch)
+                for item in batch:
+                    output.put(item)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                # The next stage (or the reader) finishes once every worker
+                # of this one has
+                workers = self._next_workers(stage)
+                for _ in range(workers):
+                    output.put(_DONE)
+
+    def _next_workers(self, stage):
+        position = self.stages.index(stage)
+        if position + 1 < len(self.stages):
+            return self.stages[position + 1].workers
+        return 1
+
+    @staticmethod
+    def _apply(stage, batch):
+        items = [item for item in batch
+                 if item.error is None and (stage.when is None or stage.when(item.value))]
+        if not items:
+            return
+        try:
+            if stage.batch_size:
+                values = stage.fn([item.value for item in items])
+            else:
+                values = [stage.fn(items[0].value)]
+            for item, value in zip(items, values):
+                item.value = value
+        except Exception as e:
+            for item in items:
+                item.error = e
@@ -0,0 +1,111 @@
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingle_hashes(text, k=5):
+    """
+    Hash every k-word shingle of text to a 32-bit integer, returning the
+    unique hashes as a uint64 array
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+
+    unique_words, inverse = np.unique(words, return_inverse=True)
+    word_hashes = np.array([zlib.crc32(word.encode('utf-8')) for word in unique_words], dtype=np.uint64)[inverse]
+    if len(word_hashes) < k:
+        k = len(word_hashes)
+
+    # Polynomial rolling combination of k consecutive word hashes
+    count = len(word_hashes) - k + 1
+    hashes = word_hashes[:count].copy()
+    for offset in range(1, k):
+        hashes = (hashes * SHINGLE_MULTIPLIER + word_hashes[offset:offset + count]) & MAX_HASH
+    return np.unique(hashes)
+
+
+class MinHasher:
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        # a and b stay below 2**32 so a * x + b cannot overflow uint64
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=1)
+
+    def signatures(self, documents, k=5):
+        return np.vstack([self.signature(shingle_hashes(text, k)) for text in documents])
+
+
+def lsh_candidates(signatures, bands=32):
+    """
+    Bucket each band of the signatures and return the set of index pairs
+    that share at least one bucket
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    candidates = set()
+    for band in range(bands):
+        band_rows = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = band_rows.view(np.dtype((np.void, band_rows.dtype.itemsize * rows))).ravel()
+        _, bucket_ids, bucket_sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        if bucket_sizes.max(initial=0) < 2:
+            continue
+        buckets = defaultdict(list)
+        for index in np.nonzero(bucket_sizes[bucket_ids] > 1)[0]:
+            buckets[bucket_ids[index]].append(int(index))
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    candidates.add((members[i], members[j]))
+    return candidates
+
+
+def find_similar_pairs(texts, threshold=0.5, num_perm=128, bands=32, k=5, seed=1):
+    """
+    Return (i, j, similarity) for every pair of texts whose estimated
+    Jaccard similarity of k-word shingles is at least threshold
+    """
+    if len(texts) < 2:
+        return []
+    signatures = MinHasher(num_perm, seed).signatures(texts, k)
+    pairs = []
+    for i, j in lsh_candidates(signatures, bands):
+        similarity = float(np.mean(signatures[i] == signatures[j]))
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+    return sorted(pairs, key=lambda pair: -pair[2])
+
+
+def plagiarism_report(texts_by_name, threshold=0.5):
+    """
+    Compare every submission in a batch and summarize near-duplicates in
+    the shape the results page expects
+    """
+    names = list(texts_by_name)
+    pairs = find_similar_pairs([texts_by_name[name] for name in names], threshold=threshold)
+
+    highest = dict.fromkeys(names, 0.0)
+    for i, j, similarity in pairs:
+        highest[names[i]] = max(highest[names[i]], similarity)
+        highest[names[j]] = max(highest[names[j]], similarity)
+
+    return {
+        "pairs": [{"a": names[i], "b": names[j], "similarity": round(similarity, 3)} for i, j, similarity in pairs],
+        "comparisonPercentage": round(100 * max(highest.values(), default=0.0)),
+        "originalityScores": {name: round(100 * (1 - score)) for name, score in highest.items()}
+    }
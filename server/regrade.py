@@ -0,0 +1,153 @@
+import hashlib
+import re
+
+from structured_output import load_json_response, validate_criterion, validate_overall
+
+# "Thesis: 10 pts", "- Use of evidence (15 points)", "2. Organization – 5 pts"
+CRITERION_PATTERN = re.compile(
+    r'^[\s\-*•]*(?:\d+[.)]\s*)?\**(?P<name>[^:()\n]*?[A-Za-z][^:()\n]*?)\**(?:\s*[:(]|\s+[-–]\s+)'
+    r'(?P<detail>.*?\d+(?:\.\d+)?\s*(?:pts?|points?)\b.*)$',
+    re.IGNORECASE
+)
+TOTAL_PATTERN = re.compile(r'^(?:grand\s+)?total\b', re.IGNORECASE)
+NAME_STRIP_PATTERN = re.compile(r'[^a-z0-9]+')
+
+REGRADE_FORMAT_INSTRUCTIONS = """
+Respond with only a JSON object, no markdown and no other text, in exactly this shape, with one entry per criteria to grade listed above:
+{"criteria": [{"name": "<criteria name>", "score": <points given>, "total": <points possible>, "comment": "<one short sentence>"}],
+ "percentage": <overall percentage grade for the whole essay, 0-100>, "letter": "<overall letter grade>",
+ "feedback": "<1-2 sentences on how to improve on these criteria>"}
+"""
+
+# Lower bound of each letter grade, highest first
+LETTER_GRADES = [(93, 'A'), (90, 'A-'), (87, 'B+'), (83, 'B'), (80, 'B-'), (77, 'C+'), (73, 'C'), (70, 'C-'),
+                 (67, 'D+'), (63, 'D'), (60, 'D-'), (0, 'F')]
+
+
+def normalize_name(name):
+    return NAME_STRIP_PATTERN.sub(' ', name.lower()).strip()
+
+
+def fingerprint(text):
+    # Whitespace and case changes don't make a new version
+    return hashlib.sha256(' '.join(text.lower().split()).encode('utf-8')).hexdigest()[:16]
+
+
+def rubric_version(rubric_text):
+    return fingerprint(rubric_text or '')
+
+
+def parse_rubric_criteria(rubric_text):
+    """
+    Pick the criteria out of a rubric summary: every line naming a
+    criteria and its points, other than the total. Returns
+    [(name, line)] in rubric order, one per name
+    """
+    criteria = []
+    seen = set()
+    for line in (rubric_text or '').splitlines():
+        match = CRITERION_PATTERN.match(line.strip())
+        if not match:
+            continue
+        name = match.group('name').strip(' *-–')
+        key = normalize_name(name)
+        if not key or key in seen or TOTAL_PATTERN.match(key):
+            continue
+        seen.add(key)
+        criteria.append((name, line.strip()))
+    return criteria
+
+
+def criteria_versions(rubric_text):
+    """
+    Map each criteria's normalized name to (name, version), where the
+    version changes whenever that criteria's rubric line does
+    """
+    return {normalize_name(name): (name, fingerprint(line)) for name, line in parse_rubric_criteria(rubric_text)}
+
+
+def match_criterion(name, versions):
+    """
+    Find the rubric criteria a graded criteria name refers to, allowing
+    for the model shortening or extending it. Returns the normalized name
+    or None
+    """
+    key = normalize_name(name)
+    if key in versions:
+        return key
+    candidates = [other for other in versions if other and (other in key or key in other)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def diff_rubrics(old_text, new_text):
+    """
+    Compare two rubric summaries criteria by criteria. Returns lists of
+    the new rubric's unchanged, changed and added criteria names and the
+    old rubric's removed ones
+    """
+    old = criteria_versions(old_text)
+    new = criteria_versions(new_text)
+    diff = {'unchanged': [], 'changed': [], 'added': [], 'removed': []}
+    for key, (name, version) in new.items():
+        if key not in old:
+            diff['added'].append(name)
+        elif old[key][1] == version:
+            diff['unchanged'].append(name)
+        else:
+            diff['changed'].append(name)
+    diff['removed'] = [name for key, (name, _) in old.items() if key not in new]
+    return diff
+
+
+def parse_criteria_grades(output_text, names):
+    """
+    Parse a regrade response into one validated criteria grade per name,
+    in the order of names, the overall (percentage, letter) or None when
+    the response has no valid one, and the feedback. Raises ValueError if
+    a criteria grade is missing or invalid
+    """
+    data = load_json_response(output_text)
+    if not isinstance(data, dict) or not isinstance(data.get('criteria'), list):
+        raise ValueError('Response must be a JSON object with a criteria list')
+
+    graded = {}
+    for item in data['criteria']:
+        item = validate_criterion(item)
+        graded[normalize_name(item['name'])] = item
+
+    versions = {normalize_name(name): (name, None) for name in names}
+    grades = []
+    for name in names:
+        key = normalize_name(name)
+        match = key if key in graded else next(
+            (other for other in graded if match_criterion(other, versions) == key), None)
+        if match is None:
+            raise ValueError(f'missing criteria: {name}')
+        grades.append(graded[match])
+    try:
+        overall = validate_overall(data)
+    except ValueError:
+        overall = None
+    return grades, overall, str(data.get('feedback') or '').strip()
+
+
+def letter_grade(percentage):
+    for bound, letter in LETTER_GRADES:
+        if percentage >= bound:
+            return letter
+    return 'F'
+
+
+def score_criteria(criteria):
+    """
+    Percentage of the points scored and its letter grade, for when a
+    regrade response has no overall grade. This is a raw ratio, not the
+    lenient overall grade the model gives, so callers report its use
+    """
+    total = sum(item['total'] for item in criteria)
+    if not total:
+        return 0, 'F'
+    percentage = round(100 * sum(item['scored'] for item in criteria) / total, 1)
+    if float(percentage).is_integer():
+        percentage = int(percentage)
+    return percentage, letter_grade(percentage)
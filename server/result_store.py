@@ -0,0 +1,406 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from regrade import normalize_name
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, list) or len(position) != 2:
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def criteria_rows(result):
+    """
+    One (result_id, position, name, key, scored, total, percent) row per
+    criteria of a result, for the indexed criteria table
+    """
+    rows = []
+    for position, item in enumerate(result.get('criteria') or []):
+        scored, total = item.get('scored'), item.get('total')
+        try:
+            percent = 100 * float(scored) / float(total) if total else None
+        except (TypeError, ValueError):
+            percent = None
+        rows.append((result['id'], position, item.get('criteria'), normalize_name(item.get('criteria') or ''),
+                     scored, total, percent))
+    return rows
+
+
+class ResultStore:
+    """
+    Keyed store of parsed grading results (criteria, percentage and letter
+    grade), replacing the old module-level visualization globals.
+
+    Recent results live in an in-memory LRU. When db_path is set every
+    result is also written to SQLite, so results survive eviction and are
+    shared between threads and worker processes. There each result's
+    course, assignment, student and grades are indexed columns and its
+    criteria scores rows of their own, so query() can page through
+    filtered results without reading the rest.
+
+    Alongside the results it keeps what a regrade needs: each essay's
+    extracted text and question by batch and name, and rubric summaries
+    by version.
+    """
+
+    # Rows read per query by iter_results
+    PAGE_SIZE = 500
+
+    def __init__(self, capacity=1000, db_path=None):
+        self.capacity = capacity
+        self.db_path = db_path
+        self._results = OrderedDict()
+        self._responses = OrderedDict()
+        self._sources = OrderedDict()
+        self._rubrics = OrderedDict()
+        self._latest_id = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if db_path:
+            self._connect().executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    id TEXT PRIMARY KEY,
+                    batch_id TEXT,
+                    assignment_id TEXT,
+                    course_id TEXT,
+                    name TEXT,
+                    percentage_grade REAL,
+                    letter_grade TEXT,
+                    response TEXT,
+                    superseded INTEGER NOT NULL DEFAULT 0,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_batch ON results (batch_id, created_at);
+                CREATE INDEX IF NOT EXISTS results_created ON results (created_at);
+                CREATE INDEX IF NOT EXISTS results_assignment ON results (assignment_id, created_at);
+                CREATE INDEX IF NOT EXISTS results_assignment_student ON results (assignment_id, name);
+                CREATE INDEX IF NOT EXISTS results_course_student ON results (course_id, name);
+                CREATE INDEX IF NOT EXISTS results_student ON results (name);
+                CREATE TABLE IF NOT EXISTS criteria (
+                    result_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    name TEXT,
+                    key TEXT NOT NULL,
+                    scored REAL,
+                    total REAL,
+                    percent REAL,
+                    PRIMARY KEY (result_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS criteria_key ON criteria (key, percent);
+                CREATE TABLE IF NOT EXISTS sources (
+                    batch_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (batch_id, name)
+                );
+                CREATE TABLE IF NOT EXISTS rubrics (
+                    version TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, keep one each
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _remember(self, result):
+        self._results[result['id']] = result
+        self._results.move_to_end(result['id'])
+        while len(self._results) > self.capacity:
+            self._results.popitem(last=False)
+
+    def put(self, result, response=None):
+        """
+        Save a result, with the response text shown for it if given. A
+        result regraded from another supersedes it in queries
+        """
+        with self._lock:
+            self._remember(result)
+            self._latest_id = result['id']
+            if response is not None:
+                self._bounded_put(self._responses, result['id'], response, self.capacity)
+        if self.db_path:
+            connection = self._connect()
+            with connection:
+                # An upsert keeps the row (and its response) when a result is saved again
+                connection.execute(
+                    'INSERT INTO results (id, batch_id, assignment_id, course_id, name, percentage_grade, letter_grade, '
+                    'response, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET batch_id = excluded.batch_id, assignment_id = excluded.assignment_id, '
+                    'course_id = excluded.course_id, name = excluded.name, percentage_grade = excluded.percentage_grade, '
+                    'letter_grade = excluded.letter_grade, response = COALESCE(excluded.response, response), '
+                    'payload = excluded.payload',
+                    (result['id'], result.get('batch_id'), result.get('assignment_id'), result.get('course_id'),
+                     result.get('name'), result.get('percentage_grade'), result.get('letter_grade'), response,
+                     json.dumps(result), result.get('created_at', time.time()))
+                )
+                connection.execute('DELETE FROM criteria WHERE result_id = ?', (result['id'],))
+                connection.executemany('INSERT INTO criteria VALUES (?, ?, ?, ?, ?, ?, ?)', criteria_rows(result))
+                if result.get('regraded_from'):
+                    connection.execute('UPDATE results SET superseded = 1 WHERE id = ?', (result['regraded_from'],))
+
+    def get(self, result_id):
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is not None:
+                self._results.move_to_end(result_id)
+                return result
+        if not self.db_path:
+            return None
+        row = self._connect().execute('SELECT payload FROM results WHERE id = ?', (result_id,)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        with self._lock:
+            self._remember(result)
+        return result
+
+    def get_batch(self, batch_id):
+        if self.db_path:
+            rows = self._connect().execute(
+                'SELECT payload FROM results WHERE batch_id = ? ORDER BY created_at, rowid', (batch_id,)
+            ).fetchall()
+            return [json.loads(row[0]) for row in rows]
+        with self._lock:
+            results = [result for result in self._results.values() if result.get('batch_id') == batch_id]
+        return sorted(results, key=lambda result: result.get('created_at', 0))
+
+    def iter_results(self, batch_id=None, assignment_id=None, include_superseded=False, page_size=None):
+        """
+        Yield the results of a batch and/or assignment oldest first, a page
+        at a time, so a whole class can be streamed without holding it in
+        memory. Each page is its own query, resuming after the last row
+        seen, so no read stays open while the caller works. Results
+        replaced by a regrade are skipped unless include_superseded is set
+        """
+        if not self.db_path:
+            with self._lock:
+                results = list(self._results.values())
+            superseded = set() if include_superseded else \
+                {result.get('regraded_from') for result in results if result.get('regraded_from')}
+            results = [result for result in results
+                       if (batch_id is None or result.get('batch_id') == batch_id)
+                       and (assignment_id is None or result.get('assignment_id') == assignment_id)
+                       and result.get('id') not in superseded]
+            yield from sorted(results, key=lambda result: result.get('created_at', 0))
+            return
+
+        filters, params = [], []
+        if not include_superseded:
+            filters.append('superseded = 0')
+        if batch_id is not None:
+            filters.append('batch_id = ?')
+            params.append(batch_id)
+        if assignment_id is not None:
+            filters.append('assignment_id = ?')
+            params.append(assignment_id)
+        where = ' AND '.join(filters) or '1'
+        page_size = page_size or self.PAGE_SIZE
+        after = None
+        while True:
+            query = f'SELECT payload, created_at, rowid FROM results WHERE {where}'
+            page_params = list(params)
+            if after:
+                query += ' AND (created_at > ? OR (created_at = ? AND rowid > ?))'
+                page_params += [after[0], after[0], after[1]]
+            rows = self._connect().execute(
+                query + ' ORDER BY created_at, rowid LIMIT ?', page_params + [page_size]
+            ).fetchall()
+            for payload, _, _ in rows:
+                yield json.loads(payload)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][1:]
+
+    def query(self, course_id=None, assignment_id=None, batch_id=None, student=None, letter=None,
+              criteria=None, below=None, at_least=None, include_superseded=False, limit=50, cursor=None,
+              count=False):
+        """
+        Page through results matching every filter given, ordered by
+        student name. below and at_least bound the percentage scored on
+        the named criteria or, without one, the overall percentage grade;
+        "all students below 70% on Thesis" is criteria='Thesis', below=70.
+        Regraded results replace the ones they came from unless
+        include_superseded is set.
+
+        Returns {'results', 'next_cursor'} and, with count set, 'total'.
+        Each result carries its response text when one was saved. Pass
+        next_cursor back to get the following page; paging resumes after
+        the last row returned rather than skipping an offset. Raises
+        ValueError for a malformed cursor
+        """
+        position = decode_cursor(cursor) if cursor else None
+        if not self.db_path:
+            return self._query_memory({
+                'course_id': course_id, 'assignment_id': assignment_id, 'batch_id': batch_id, 'student': student,
+                'letter': letter, 'criteria': criteria, 'below': below, 'at_least': at_least,
+                'include_superseded': include_superseded, 'limit': limit, 'count': count
+            }, position)
+
+        filters, params = [], []
+        if not include_superseded:
+            filters.append('r.superseded = 0')
+        for column, value in (('course_id', course_id), ('assignment_id', assignment_id), ('batch_id', batch_id),
+                              ('name', student), ('letter_grade', letter)):
+            if value is not None:
+                filters.append(f'r.{column} = ?')
+                params.append(value)
+        bounds, bound_params = [], []
+        if below is not None:
+            bounds.append('{} < ?')
+            bound_params.append(below)
+        if at_least is not None:
+            bounds.append('{} >= ?')
+            bound_params.append(at_least)
+        if criteria:
+            # The unary + keeps SQLite on the primary key, a few rows per
+            # result, instead of scanning criteria_key for every result
+            conditions = ['c.result_id = r.id', '+c.key = ?'] + [bound.format('+c.percent') for bound in bounds]
+            filters.append(f"EXISTS (SELECT 1 FROM criteria c WHERE {' AND '.join(conditions)})")
+            params += [normalize_name(criteria)] + bound_params
+        else:
+            filters += [bound.format('r.percentage_grade') for bound in bounds]
+            params += bound_params
+        where = ' AND '.join(filters) or '1'
+
+        connection = self._connect()
+        page = {}
+        if count:
+            page['total'] = connection.execute(f'SELECT COUNT(*) FROM results r WHERE {where}', params).fetchone()[0]
+        page_filter, page_params = '', []
+        if position:
+            page_filter = ' AND (r.name > ? OR (r.name = ? AND r.rowid > ?))'
+            page_params = [position[0], position[0], position[1]]
+        rows = connection.execute(
+            f'SELECT r.payload, r.response, r.name, r.rowid FROM results r WHERE {where}{page_filter} '
+            'ORDER BY r.name, r.rowid LIMIT ?', params + page_params + [limit + 1]
+        ).fetchall()
+
+        results = []
+        for payload, response, _, _ in rows[:limit]:
+            result = json.loads(payload)
+            if response is not None:
+                result['response'] = response
+            results.append(result)
+        page['results'] = results
+        page['next_cursor'] = encode_cursor(list(rows[limit - 1][2:])) if len(rows) > limit else None
+        return page
+
+    def _query_memory(self, options, position):
+        # Without a database only the results still in memory can be queried
+        with self._lock:
+            results = list(self._results.values())
+            responses = dict(self._responses)
+        superseded = set() if options['include_superseded'] else \
+            {result.get('regraded_from') for result in results if result.get('regraded_from')}
+
+        def in_bounds(value):
+            if options['below'] is None and options['at_least'] is None:
+                return True
+            if value is None:
+                return False
+            return (options['below'] is None or value < options['below']) and \
+                (options['at_least'] is None or value >= options['at_least'])
+
+        def matches(result):
+            if result['id'] in superseded:
+                return False
+            for key, option in (('course_id', 'course_id'), ('assignment_id', 'assignment_id'),
+                                ('batch_id', 'batch_id'), ('name', 'student'), ('letter_grade', 'letter')):
+                if options[option] is not None and result.get(key) != options[option]:
+                    return False
+            if not options['criteria']:
+                return in_bounds(result.get('percentage_grade'))
+            key = normalize_name(options['criteria'])
+            return any(row[3] == key and in_bounds(row[6]) for row in criteria_rows(result))
+
+        matching = sorted((result for result in results if matches(result)),
+                          key=lambda result: (result.get('name') or '', result['id']))
+        page = {'total': len(matching)} if options['count'] else {}
+        if position:
+            matching = [result for result in matching if (result.get('name') or '', result['id']) > tuple(position)]
+        limit = options['limit']
+        page['results'] = [dict(result, response=responses[result['id']]) if result['id'] in responses else result
+                           for result in matching[:limit]]
+        last = matching[limit - 1] if len(matching) > limit else None
+        page['next_cursor'] = encode_cursor([last.get('name') or '', last['id']]) if last else None
+        return page
+
+    def latest(self):
+        if self.db_path:
+            row = self._connect().execute('SELECT payload FROM results ORDER BY created_at DESC, rowid DESC LIMIT 1').fetchone()
+            return json.loads(row[0]) if row else None
+        with self._lock:
+            return self._results.get(self._latest_id) if self._latest_id else None
+
+    @staticmethod
+    def _bounded_put(entries, key, value, capacity):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > capacity:
+            entries.popitem(last=False)
+
+    def put_source(self, batch_id, name, source):
+        """
+        Keep what a submission was graded from (a dict with its extracted
+        text and question) so it can be regraded without re-extracting it
+        """
+        if self.db_path:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO sources (batch_id, name, payload, created_at) VALUES (?, ?, ?, ?)',
+                    (batch_id, name, json.dumps(source), time.time())
+                )
+            return
+        with self._lock:
+            self._bounded_put(self._sources, (batch_id, name), source, self.capacity)
+
+    def get_source(self, batch_id, name):
+        if self.db_path:
+            row = self._connect().execute(
+                'SELECT payload FROM sources WHERE batch_id = ? AND name = ?', (batch_id, name)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        with self._lock:
+            return self._sources.get((batch_id, name))
+
+    def put_rubric(self, version, text):
+        if self.db_path:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    'INSERT OR IGNORE INTO rubrics (version, text, created_at) VALUES (?, ?, ?)',
+                    (version, text, time.time())
+                )
+            return
+        with self._lock:
+            self._bounded_put(self._rubrics, version, text, self.capacity)
+
+    def get_rubric(self, version):
+        if self.db_path:
+            row = self._connect().execute('SELECT text FROM rubrics WHERE version = ?', (version,)).fetchone()
+            return row[0] if row else None
+        with self._lock:
+            return self._rubrics.get(version)
@@ -1,115 +1,571 @@
 import json
 import random
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
-from langchain.docstore.document import Document
-import tempfile
-from PIL import Image
 import re
-import requests
+from rubric_cache import RubricCache
+from jobs import JobManager
+from concurrency import RateLimiter, map_ordered
+from pipeline import Pipeline, Stage
+from concurrent.futures import ThreadPoolExecutor
+from downloader import Downloader
+from extraction import PdfExtractor
+from images import ImageNormalizer
+from result_store import ResultStore
+from vector_index import VectorIndexer
+from llm_cache import ResponseCache
+from llm_registry import LLMRegistry
+from llm_calls import CallPolicy
+from metrics import Metrics
+from tokens import TokenUsage, count_tokens, split_by_tokens
+from streaming import stream_grading
+from export import FORMATS as EXPORT_FORMATS, export_chunks
+from uploads import Uploads, name_of, read_file, source_of, spooled_request_class
+from structured_output import STRUCTURED_FORMAT_INSTRUCTIONS, parse_structured_grade, render_grade
+from regrade import (REGRADE_FORMAT_INSTRUCTIONS, criteria_versions, diff_rubrics, match_criterion, normalize_name,
+                     parse_criteria_grades, rubric_version, score_criteria)
+from packing import PACKED_FORMAT_INSTRUCTIONS, dump_grade, format_packed_submissions, pack_submissions, parse_packed_grades
+import hashlib
+import importlib.util
+import math
+import sys
+import threading
+import time
+import uuid
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
-# Load environment variables and configure Gemini
+# Load environment variables; Gemini is configured when first used
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=API_KEY)
 
-# Initialize variables
-visualization_data = []
-percentage_grade = None
-letter_grade = None
+def is_enabled(value):
+    return (value or "").lower() in ("1", "true", "yes", "on")
+
+RUBRIC_MODEL = "gemini-2.0-flash"
+GRADING_MODEL = "gemini-2.0-flash"
+VISION_MODEL = "gemini-1.5-flash"
+
+# Bump when a grading prompt changes so cached responses aren't reused
+PROMPT_VERSION = "2"
+
+# "json" asks the model for a schema-validated JSON grade instead of prose
+GRADING_OUTPUT = os.getenv("GRADING_OUTPUT", "text")
+
+# Essays that fit the grading model's context are sent whole, once; longer
+# ones are summarized part by part and graded from the notes (map-reduce).
+# The reserve covers the grading instructions and the response
+GRADING_CONTEXT_TOKENS = int(os.getenv("GRADING_CONTEXT_TOKENS", 1000000))
+GRADING_RESERVED_TOKENS = int(os.getenv("GRADING_RESERVED_TOKENS", 10000))
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", 100000))
+
+# Short submissions can be graded several to a call so the long grading
+# instructions are sent once per pack instead of once per student
+PACKED_GRADING = is_enabled(os.getenv("PACKED_GRADING"))
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 6000))
+PACK_MAX_SUBMISSIONS = int(os.getenv("PACK_MAX_SUBMISSIONS", 8))
+PACK_MAX_SUBMISSION_TOKENS = int(os.getenv("PACK_MAX_SUBMISSION_TOKENS", 1000))
+
+# Each uploaded file stays in memory up to the first size, and all of a
+# request's files up to the second; the rest are spilled to temporary files
+UPLOAD_MEMORY_BYTES = int(os.getenv("UPLOAD_MEMORY_BYTES", 8 * 1024 * 1024))
+UPLOAD_REQUEST_MEMORY_BYTES = int(os.getenv("UPLOAD_REQUEST_MEMORY_BYTES", 32 * 1024 * 1024))
+app.request_class = spooled_request_class(UPLOAD_MEMORY_BYTES, UPLOAD_REQUEST_MEMORY_BYTES)
+
+# Rubric summaries are cached on disk so a rubric is only extracted once
+rubric_cache = RubricCache(
+    os.getenv("RUBRIC_CACHE_DIR", "rubric_cache"),
+    max_bytes=int(os.getenv("RUBRIC_CACHE_MAX_BYTES", 10 * 1024 * 1024))
+)
+
+# LLM clients and chains are built once per model and prompt variant
+llm_registry = LLMRegistry()
+
+# Grading responses are cached so re-grades and retries skip the LLM call
+response_cache = ResponseCache(
+    os.getenv("LLM_CACHE_DB", "llm_cache.sqlite3"),
+    ttl=int(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+) if os.getenv("LLM_CACHE_DB", "llm_cache.sqlite3") else None
+
+# Bulk grading jobs run on a background worker pool (0 runs them inline)
+job_manager = JobManager(workers=int(os.getenv("JOB_WORKERS", 2)))
+
+# Submission URLs are fetched by the pipeline's fetch workers over one
+# keep-alive session
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 8))
+downloader = Downloader(
+    workers=DOWNLOAD_WORKERS,
+    timeout=float(os.getenv("DOWNLOAD_TIMEOUT", 30)),
+    max_bytes=int(os.getenv("DOWNLOAD_MAX_BYTES", 25 * 1024 * 1024))
+)
+
+# PDF text extraction is spread over worker processes, page ranges at a time
+pdf_extractor = PdfExtractor(
+    workers=int(os.getenv("PDF_WORKERS", os.cpu_count() or 1)),
+    pages_per_task=int(os.getenv("PDF_PAGES_PER_TASK", 16))
+)
+
+# Uploaded photos are downscaled and re-encoded before the vision call
+image_normalizer = ImageNormalizer(
+    workers=int(os.getenv("IMAGE_WORKERS", 4)),
+    max_edge=int(os.getenv("IMAGE_MAX_EDGE", 1600)),
+    grayscale=is_enabled(os.getenv("IMAGE_GRAYSCALE")),
+    autocontrast=is_enabled(os.getenv("IMAGE_AUTOCONTRAST")),
+    quality=int(os.getenv("IMAGE_QUALITY", 85))
+)
+
+# Submissions can be embedded into a persistent per-assignment FAISS index in
+# the background; grading doesn't query it, so it is off by default
+vector_indexer = VectorIndexer(
+    os.getenv("VECTOR_INDEX_DIR", "vector_indexes"),
+    enabled=is_enabled(os.getenv("VECTOR_INDEX_ENABLED")),
+    index_type=os.getenv("VECTOR_INDEX_TYPE", "flat"),
+    train_size=int(os.getenv("VECTOR_INDEX_TRAIN_SIZE", 256)),
+    save_every=int(os.getenv("VECTOR_INDEX_SAVE_EVERY", 50))
+)
+
+# Per-student LLM calls fan out over a shared pool; every attempt of every
+# call, retries and hedges included, is throttled across requests
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", 8))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix='llm')
+llm_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("LLM_RPM", 0)),
+    tokens_per_minute=int(os.getenv("LLM_TPM", 0))
+)
+
+# Each request runs its submissions through fetch -> extract -> grade stages
+# joined by bounded queues; a full queue holds back the stage before it.
+# Extract workers take up to PIPELINE_EXTRACT_BATCH waiting PDFs at once so
+# they are parsed together across the PDF process pool. Grade workers only
+# hand calls to the shared LLM pool, which caps them
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
+PIPELINE_EXTRACT_WORKERS = int(os.getenv("PIPELINE_EXTRACT_WORKERS", 2))
+PIPELINE_EXTRACT_BATCH = int(os.getenv("PIPELINE_EXTRACT_BATCH", 8))
+PIPELINE_GRADE_WORKERS = int(os.getenv("PIPELINE_GRADE_WORKERS", LLM_WORKERS))
+
+# Every LLM call gets a deadline and jittered retries on 429/5xx errors;
+# hedging sends a duplicate of calls slower than that latency quantile.
+# Calls run on their own threads: room for each LLM worker's call, its
+# hedge and attempts abandoned at the deadline that are still winding down
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 120))
+llm_policy = CallPolicy(
+    deadline=LLM_DEADLINE,
+    workers=int(os.getenv("LLM_CALL_WORKERS", 4 * LLM_WORKERS)),
+    retries=int(os.getenv("LLM_RETRIES", 2)),
+    backoff=float(os.getenv("LLM_BACKOFF", 1.0)),
+    max_backoff=float(os.getenv("LLM_MAX_BACKOFF", 20)),
+    hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", 0)),
+    hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20)),
+    limiter=llm_limiter
+)
+
+# Parsed results are kept per submission so concurrent requests don't clash,
+# and saved to a SQLite grade database unless RESULT_DB is set empty
+result_store = ResultStore(
+    capacity=int(os.getenv("RESULT_STORE_CAPACITY", 1000)),
+    db_path=os.getenv("RESULT_DB", "results.sqlite3") or None
+)
+
+# Page size of /api/results when none is asked for, and the largest allowed
+RESULTS_PAGE_SIZE = int(os.getenv("RESULTS_PAGE_SIZE", 50))
+RESULTS_PAGE_MAX = int(os.getenv("RESULTS_PAGE_MAX", 500))
+
+# Rows encoded per chunk of a grade export (per row group for Parquet)
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 0)) or None
+
+# Per-stage latency histograms and LLM call counts, served at /metrics
+metrics = Metrics(enabled=is_enabled(os.getenv("METRICS_ENABLED")))
+
+# LangChain, the Gemini SDKs, PyPDF2, PIL, numpy and FAISS are imported by
+# the stage that needs them, so a new worker starts serving quickly
 
 def convert_text_to_documents(text_chunks):
+    from langchain.docstore.document import Document
     return [Document(page_content=chunk) for chunk in text_chunks]
 
+@metrics.timed("pdf_text")
 def get_pdf_text(pdf_docs):
-    text = ""
     tasks = {}
 
-    for pdf in pdf_docs:
-        try:
-            pdf_reader = PdfReader(pdf, strict=False)  # Added strict=False to be more lenient with malformed PDFs
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            tasks[pdf] = text
-        except Exception as e:
-            print(f"Error reading PDF {pdf}: {str(e)}")
-            tasks[pdf] = "Error: Could not read PDF file. The file might be corrupted or malformed."
+    # Keyed by the Upload or path passed in, so identical files stay apart
+    results = pdf_extractor.extract([source_of(doc) for doc in pdf_docs])
+    for doc, result in zip(pdf_docs, results):
+        if result.error:
+            print(f"Error reading PDF {name_of(doc)}: {result.error}")
+            tasks[doc] = "Error: Could not read PDF file. The file might be corrupted or malformed."
+        else:
+            tasks[doc] = result.text
     
     return tasks
 
 def get_text_chunks(text):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=1000)
     chunks = text_splitter.split_text(text)
     return chunks
 
-def get_vector_store(text_chunks):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
-    vector_store.save_local("faiss_index")
+def get_assignment_id(question, assignment=None):
+    # Submissions are grouped by an explicit assignment id, or by their question
+    return assignment or hashlib.sha256(question.encode('utf-8')).hexdigest()[:16]
+
+@metrics.timed("vector_index")
+def index_submission(assignment_id, name, text):
+    """
+    Queue a submission's text to be appended to its assignment's vector index
+    """
+    if not vector_indexer.enabled:
+        return
+    text_chunks = get_text_chunks(text)
+    metadata = {"assignment": assignment_id, "student": name}
+    vector_indexer.submit(assignment_id, text_chunks, [metadata] * len(text_chunks))
+
+def call_llm(kind, fn, *args, tokens=0, **kwargs):
+    """
+    Make one LLM call under llm_policy, timing and counting every attempt.
+    Each attempt takes a request and tokens, the prompt's size, from the
+    shared rate limit
+    """
+    def attempt(*args, **kwargs):
+        with metrics.llm_call(kind):
+            return fn(*args, **kwargs)
+    return llm_policy.call(kind, attempt, *args, tokens=tokens, **kwargs)
+
+GRADING_ERROR_PREFIX = "Error: This submission could not be graded"
+GRADING_ERROR = GRADING_ERROR_PREFIX + " ({error}). Please try grading it again."
+
+def try_grade(grade, *args, **kwargs):
+    """
+    Run one student's grading call, turning a failure into that student's
+    error response so the rest of the batch keeps its grades
+    """
+    try:
+        return grade(*args, **kwargs)
+    except Exception as e:
+        print(f"Grading failed: {str(e)}")
+        return GRADING_ERROR.format(error=str(e) or type(e).__name__)
+
+def get_genai():
+    def build():
+        import google.generativeai as genai
+        genai.configure(api_key=API_KEY)
+        return genai
+    return llm_registry.get(("genai",), build)
+
+def get_chat_model(model_name):
+    def build():
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        # Abandoned attempts stop too instead of holding a call thread
+        return ChatGoogleGenerativeAI(model=model_name, temperature=0.3, timeout=LLM_DEADLINE or None)
+    return llm_registry.get(("chat", model_name), build)
 
 def get_rubric_chain():
+    return llm_registry.get(("rubric_chain", RUBRIC_MODEL), build_rubric_chain)
+
+def build_rubric_chain():
+    from langchain.chains.question_answering import load_qa_chain
+    from langchain.prompts import PromptTemplate
+
     prompt_template = f"""
     Extract the given total points, criteria, and points/pts from the given rubric:\n {{context}}?\n
 
     Answer:
     """
-    model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
+    model = get_chat_model(RUBRIC_MODEL)
     prompt = PromptTemplate(
         template=prompt_template, input_variables=["context"]
     )
     chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
     return chain
 
-def get_gemini_response(image, prompt):
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content([prompt, image[0]])
+@metrics.timed("rubric")
+def get_rubric_summary(rubric_file):
+    """
+    Extract the criteria and points from a rubric PDF, reusing the cached
+    summary when the same rubric has already been processed
+    """
+    rubric_bytes = read_file(rubric_file)
+
+    key = rubric_cache.key(rubric_bytes, RUBRIC_MODEL)
+    summary = rubric_cache.get(key)
+    if summary is not None:
+        return summary
+
+    rubric_str = get_pdf_text([rubric_file])[rubric_file]
+    rubric_chain = get_rubric_chain()
+    response = call_llm("rubric", rubric_chain, {"input_documents": convert_text_to_documents([rubric_str])}, return_only_outputs=True,
+                        tokens=count_tokens(rubric_str))
+    summary = response["output_text"]
+
+    # Don't cache failures so a fixed upload gets a fresh extraction
+    if not rubric_str.startswith("Error:"):
+        rubric_cache.put(key, summary)
+    return summary
+
+def get_vision_model(structured=False):
+    def build():
+        generation_config = {"response_mime_type": "application/json"} if structured else None
+        return get_genai().GenerativeModel(VISION_MODEL, generation_config=generation_config)
+    return llm_registry.get(("vision", VISION_MODEL, structured), build)
+
+def get_gemini_response(images, prompt, structured=False):
+    model = get_vision_model(structured)
+    # Every page of the submission goes in the same call, in order
+    request_options = {"timeout": LLM_DEADLINE} if LLM_DEADLINE else None
+    response = call_llm("vision", model.generate_content, [prompt, *images], request_options=request_options,
+                        tokens=count_tokens(prompt) + IMAGE_TOKENS * len(images))
     return response.text
 
-def get_conversational_chain(rubric=None):
+def cache_bypassed():
+    # no_cache=true or Cache-Control: no-cache forces fresh LLM calls
+    return is_enabled(request.form.get('no_cache')) or 'no-cache' in request.headers.get('Cache-Control', '')
+
+def use_structured_output(value=None):
+    # The per-request 'output' field overrides the GRADING_OUTPUT default
+    return (value or GRADING_OUTPUT).lower() == "json"
+
+GRADING_GUIDELINES = """    Respond back with graded points and a level for each criteria. Don't rewrite the rubric. For each criteria, provide a brief comment (1-2 lines) explaining the score.
+    In the end, write short feedback about what steps they might take to improve on their assignment. Write a total percentage grade and letter grade. In your overall response, try to be lenient and keep in mind that the student is still learning. While grading the essay remember the writing level the student is at while considering their course level, grade level, and the overall expectations of writing should be producing.
+    Your grade should only be below 70 percent if the essay does not succeed at all in any of the criteria. Your grade should only be below 80 percent if the essay is not sufficient in most of the criteria. Your grade should only be below 90% if there are a few criteria where the essay doesn't excell. Your grade should only be above 90 percent if the essay succeeds in most of the criteria.
+    Understand that the essay was written by a human and think about their writing expectations for their grade level/course level, be lenient and give the student the benefit of the doubt.
+"""
+
+def get_conversational_chain(rubric=None, structured=False):
+    # The rubric is a prompt variable, so only whether there is one matters
+    return llm_registry.get(
+        ("grading_chain", GRADING_MODEL, bool(rubric), structured),
+        lambda: build_conversational_chain(bool(rubric), structured)
+    )
+
+def build_conversational_chain(rubric=False, structured=False):
+    from langchain.chains.question_answering import load_qa_chain
+    from langchain.prompts import PromptTemplate
+
     if rubric:
         rubric_text = f" according to the provided rubric:\n{{rubric}}. Strictly based on the grading criteria, total points, and the points for each criteria given in the provided rubric do the grading\n"
     else:
         rubric_text = " based on the general grading criteria.\n"
-    
-    prompt_template = f"""
-    You are a trained expert on writing and literary analysis. Your job is to accurately and effectively grade a student's essay{rubric_text}
-    Respond back with graded points and a level for each criteria. Don't rewrite the rubric. For each criteria, provide a brief comment (1-2 lines) explaining the score.
-    In the end, write short feedback about what steps they might take to improve on their assignment. Write a total percentage grade and letter grade. In your overall response, try to be lenient and keep in mind that the student is still learning. While grading the essay remember the writing level the student is at while considering their course level, grade level, and the overall expectations of writing should be producing.
-    Your grade should only be below 70 percent if the essay does not succeed at all in any of the criteria. Your grade should only be below 80 percent if the essay is not sufficient in most of the criteria. Your grade should only be below 90% if there are a few criteria where the essay doesn't excell. Your grade should only be above 90 percent if the essay succeeds in most of the criteria.
-    Understand that the essay was written by a human and think about their writing expectations for their grade level/course level, be lenient and give the student the benefit of the doubt.
 
+    if structured:
+        # Braces are doubled so PromptTemplate leaves the JSON shape alone
+        format_text = STRUCTURED_FORMAT_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
+        answer_text = "Answer with the JSON object only, for the criteria present in rubric."
+    else:
+        format_text = """
     Format each criteria exactly like this:
     • Criteria_name: score/total
       Brief comment explaining the score (1-2 lines maximum)
-
+"""
+        answer_text = "Answer: Get the answer in beautiful format, for the criteria present in rubric list them as specified above."
+    
+    prompt_template = f"""
+    You are a trained expert on writing and literary analysis. Your job is to accurately and effectively grade a student's essay{rubric_text}
+{GRADING_GUIDELINES}{format_text}
         Context:\n {{context}}?\n
         Question: \n{{question}}\n
 
-    Answer: Get the answer in beautiful format, for the criteria present in rubric list them as specified above.
+    {answer_text}
     """
-    model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
+    model = get_chat_model(GRADING_MODEL)
     prompt = PromptTemplate(
         template=prompt_template, input_variables=["rubric", "context", "question"]
     )
     chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
     return chain
 
+ESSAY_NOTES_PROMPT = """
+    You are helping grade a student essay that is too long to read in one pass. Below is part {part} of {parts} of the essay.
+    Write concise notes on how this part performs against each criteria{rubric}, quoting short pieces of evidence. Do not give a grade.
+
+    Question: {question}
+
+    Essay part {part}:
+    {chunk}
+    """
+
+ESSAY_NOTES_HEADER = "The essay was too long to grade in one pass. These are a grader's notes on each part of it, in order; grade the whole essay from them.\n\n"
+
+# The old grading path split essays into overlapping character chunks
+BASELINE_CHUNK_CHARS = 10000
+BASELINE_OVERLAP_CHARS = 1000
+
+def get_baseline_tokens(text, tokens=None):
+    # What the old overlapping 10k/1k character chunks sent for this essay:
+    # the whole text plus the overlap repeated at the start of every chunk
+    # after the first. tokens is count_tokens(text) when already known
+    tokens = count_tokens(text) if tokens is None else tokens
+    if len(text) <= BASELINE_CHUNK_CHARS:
+        return tokens
+    chunks = math.ceil((len(text) - BASELINE_OVERLAP_CHARS) / (BASELINE_CHUNK_CHARS - BASELINE_OVERLAP_CHARS))
+    return round(tokens * (len(text) + (chunks - 1) * BASELINE_OVERLAP_CHARS) / len(text))
+
+def get_essay_budget(rubric_text, question):
+    return GRADING_CONTEXT_TOKENS - GRADING_RESERVED_TOKENS - count_tokens(rubric_text or "") - count_tokens(question)
+
+def get_essay_notes(text, rubric_text, question, budget):
+    """
+    Map step for essays too long for one call: take notes on each part of
+    the essay against the rubric, the parts concurrently on the shared LLM
+    pool. Returns the notes, in order
+    """
+    chunks = split_by_tokens(text, max(1, min(MAP_CHUNK_TOKENS, budget)))
+    rubric = f" in this rubric:\n{rubric_text}\n" if rubric_text else " of good writing"
+    model = get_chat_model(GRADING_MODEL)
+
+    def take_notes(part):
+        prompt = ESSAY_NOTES_PROMPT.format(part=part[0], parts=len(chunks), rubric=rubric, question=question,
+                                           chunk=part[1])
+        response = call_llm("notes", model.invoke, prompt, tokens=count_tokens(prompt))
+        return f"Notes on part {part[0]} of {len(chunks)}:\n" + response.content
+
+    # Usually called from the pool itself, so parts no worker is free for
+    # are taken by this thread
+    return list(map_ordered(llm_executor, take_notes, enumerate(chunks, start=1), caller_runs=True))
+
+def has_grade(output_text, structured=False):
+    """
+    Whether a grading response parses: a schema-valid JSON grade, or prose
+    with a total percentage grade. Only responses that do are cached, so a
+    malformed one is asked for again next time instead of being reused
+    """
+    if structured:
+        try:
+            parse_structured_grade(output_text)
+        except ValueError:
+            return False
+        return True
+    return any("Total Percentage Grade" in line and re.search(r'\d', line.partition(':')[2])
+               for line in output_text.split('\n'))
+
+@metrics.timed("grade_essay")
+def grade_essay(text, rubric_text, question, structured=False, use_cache=True, usage=None):
+    """
+    Grade one student's extracted text and return the model's response.
+    A cached response is reused unless use_cache is False. The essay is
+    sent whole when it fits the model's context and graded from per-part
+    notes when it doesn't; usage, a TokenUsage, tallies the tokens sent
+    """
+    key = None
+    if response_cache:
+        key = response_cache.key(GRADING_MODEL, PROMPT_VERSION, "json" if structured else "text", rubric_text, question, text)
+        cached = response_cache.get(key) if use_cache else None
+        if cached is not None:
+            return cached
+
+    budget = get_essay_budget(rubric_text, question)
+    tokens_sent = essay_tokens = count_tokens(text)
+    map_reduce = tokens_sent > budget
+    if map_reduce:
+        notes = ESSAY_NOTES_HEADER + "\n\n".join(get_essay_notes(text, rubric_text, question, budget))
+        document_tokens = count_tokens(notes)
+        tokens_sent += document_tokens
+        documents = convert_text_to_documents([notes])
+    else:
+        document_tokens = essay_tokens
+        documents = convert_text_to_documents([text])
+
+    chain = get_conversational_chain(rubric=rubric_text, structured=structured)
+
+    response = call_llm("grading", chain, {"input_documents": documents, "rubric": rubric_text, "question": question}, return_only_outputs=True,
+                        tokens=document_tokens + count_tokens((rubric_text or "") + (question or "")))
+    if usage:
+        usage.add(tokens_sent, get_baseline_tokens(text, essay_tokens), map_reduce)
+    if key and has_grade(response["output_text"], structured):
+        response_cache.put(key, response["output_text"])
+    return response["output_text"]
+
+def get_packed_prompt(rubric_text, question, submissions):
+    if rubric_text:
+        rubric_text = f" according to the provided rubric:\n{rubric_text}. Strictly based on the grading criteria, total points, and the points for each criteria given in the provided rubric do the grading\n"
+    else:
+        rubric_text = " based on the general grading criteria.\n"
+    return f"""
+    You are a trained expert on writing and literary analysis. Your job is to accurately and effectively grade each of the following students' essays{rubric_text}
+{GRADING_GUIDELINES}
+{PACKED_FORMAT_INSTRUCTIONS}
+        Submissions:\n {submissions}\n
+        Question: \n{question}\n
+    """
+
+def grade_packed_essays(texts, rubric_text, question, structured=False, use_cache=True, usage=None):
+    """
+    Grade several short essays in a single LLM call, returning one response
+    per text. Responses that are missing or fail validation fall back to
+    grading each essay with its own call
+    """
+    mode = "json" if structured else "text"
+    keys = [None] * len(texts)
+    outputs = [None] * len(texts)
+    if response_cache:
+        for index, text in enumerate(texts):
+            keys[index] = response_cache.key(GRADING_MODEL, PROMPT_VERSION, "packed", mode, rubric_text, question, text)
+            outputs[index] = response_cache.get(keys[index]) if use_cache else None
+
+    pending = [index for index, output in enumerate(outputs) if output is None]
+    if len(pending) == 1:
+        outputs[pending[0]] = try_grade(grade_essay, texts[pending[0]], rubric_text, question, structured, use_cache, usage)
+        pending = []
+    if not pending:
+        return outputs
+
+    ids, submissions = format_packed_submissions([texts[index] for index in pending])
+    model = get_chat_model(GRADING_MODEL)
+    try:
+        prompt = get_packed_prompt(rubric_text, question, submissions)
+        response = call_llm("packed", model.invoke, prompt, tokens=count_tokens(prompt))
+        grades = parse_packed_grades(response.content, ids)
+    except Exception as e:
+        print(f"Packed grading of {len(pending)} submissions failed, grading them one at a time: {str(e)}")
+        for index in pending:
+            outputs[index] = try_grade(grade_essay, texts[index], rubric_text, question, structured, use_cache, usage)
+        return outputs
+
+    for index, grade in zip(pending, grades):
+        if usage:
+            tokens = count_tokens(texts[index])
+            usage.add(tokens, get_baseline_tokens(texts[index], tokens))
+        outputs[index] = dump_grade(grade) if structured else render_grade(grade)
+        if keys[index]:
+            response_cache.put(keys[index], outputs[index])
+    return outputs
+
+def grade_batch(submissions, rubric_text, question, structured=False, use_cache=True, pack=False, usage=None):
+    """
+    Grade a batch of Submissions concurrently on the shared LLM pool,
+    setting each one's response. Each essay gets its own call unless pack
+    is set, in which case runs of short essays share calls of up to
+    PACK_TOKEN_BUDGET tokens; each student's images go in one vision call
+    """
+    essays = [submission for submission in submissions if submission.kind == 'pdf']
+    if pack:
+        sizes = [count_tokens(submission.text) for submission in essays]
+        packs = pack_submissions(sizes, PACK_TOKEN_BUDGET, PACK_MAX_SUBMISSIONS, PACK_MAX_SUBMISSION_TOKENS)
+    else:
+        packs = [[index] for index in range(len(essays))]
+
+    # The submissions sharing each call; the calls take their own rate limit
+    calls = [[essays[index] for index in indexes] for indexes in packs]
+    calls += [[submission] for submission in submissions if submission.kind == 'image']
+
+    def grade(group):
+        if group[0].kind == 'image':
+            return [try_grade(grade_image_files, group[0].files, structured, use_cache)]
+        if len(group) == 1:
+            return [try_grade(grade_essay, group[0].text, rubric_text, question, structured, use_cache, usage)]
+        return grade_packed_essays([submission.text for submission in group], rubric_text, question, structured, use_cache, usage)
+
+    outputs = map_ordered(llm_executor, grade, calls)
+    for group, responses in zip(calls, outputs):
+        for submission, response in zip(group, responses):
+            submission.response = response
+    return submissions
+
 def extract_criteria_and_values(output_text):
     lines = output_text.split('\n')
-    visualization_data.clear()  # Clear previous data
+    visualization_data = []
 
     for line in lines:
         line = line.strip()
@@ -181,8 +637,9 @@ def extract_criteria_and_values(output_text):
                 # Skip if conversion to integers fails
                 pass
 
+    return visualization_data
+
 def create_visualizations(output_text):
-    global percentage_grade, letter_grade
     lines = output_text.split('\n')
 
     # Default values in case we don't find matches
@@ -217,167 +674,700 @@ def create_visualizations(output_text):
     if letter_grade is None:
         letter_grade = ""
 
-def input_image_setup(image_paths):
+    return percentage_grade, letter_grade
+
+@metrics.timed("parse")
+def record_result(batch_id, name, output_text, structured=False, rubric_text=None, assignment_id=None,
+                  course_id=None):
+    """
+    Parse a grading response and save it in the result store. Structured
+    responses are validated and rendered to prose here; one that doesn't
+    match the schema is recorded as an error rather than a zero. With rubric_text,
+    the result and each criteria are stamped with the rubric version that
+    produced them, for regrades. assignment_id and course_id are kept for
+    exports and queries. Returns the response text to show and the stored
+    result
+    """
+    grade = None
+    error = output_text if output_text.startswith(GRADING_ERROR_PREFIX) else None
+    if structured and not error:
+        try:
+            grade = parse_structured_grade(output_text)
+        except ValueError as e:
+            print(f"Invalid structured response for {name}: {str(e)}")
+            output_text = error = GRADING_ERROR.format(error=f"invalid structured response: {e}")
+
+    if grade:
+        output_text = render_grade(grade)
+        criteria = [
+            {"criteria": item["name"], "scored": item["score"], "total": item["total"], "comment": item["comment"]}
+            for item in grade["criteria"]
+        ]
+        percentage_grade, letter_grade = grade["percentage"], grade["letter"]
+    elif error:
+        # A failed call has no grade, not a zero
+        criteria, percentage_grade, letter_grade = [], None, None
+    else:
+        criteria = extract_criteria_and_values(output_text)
+        percentage_grade, letter_grade = create_visualizations(output_text)
+
+    result = {
+        "id": uuid.uuid4().hex,
+        "batch_id": batch_id,
+        "assignment_id": assignment_id,
+        "course_id": course_id,
+        "name": name,
+        "criteria": criteria,
+        "percentage_grade": percentage_grade,
+        "letter_grade": letter_grade,
+        "error": error,
+        "created_at": time.time()
+    }
+    if rubric_text and not error:
+        versions = criteria_versions(rubric_text)
+        for item in criteria:
+            key = match_criterion(item["criteria"], versions)
+            item["version"] = versions[key][1] if key else None
+        result["rubric_version"] = rubric_version(rubric_text)
+    result_store.put(result, output_text)
+    return output_text, result
+
+IMAGE_GRADING_PROMPT = """
+You are an expert grader. Your task is to grade the student's solution shown in the image(s).
+If there are several images they are consecutive pages of the same solution, in order.
+
+Follow these steps:
+1. First, carefully read and understand what the student has written/solved
+2. Examine the solution in detail, looking at both the process and final answer
+3. Grade based on mathematical accuracy, problem-solving approach, and clarity of work
+4. Provide specific feedback on what was done well and what could be improved
+
+Use exactly this format:
+
+Student's Solution Analysis:
+[Brief analysis of the student's work and approach]
+
+Grading:
+• Mathematical Accuracy: score/20
+  [Brief explanation of score]
+• Problem-Solving Approach: score/20
+  [Brief explanation of score]
+• Work Clarity: score/10
+  [Brief explanation of score]
+
+Total Percentage Grade: [X]%
+Letter Grade: [X]
+
+Feedback:
+[2-3 sentences of constructive feedback]
+"""
+
+IMAGE_GRADING_JSON_PROMPT = """
+You are an expert grader. Your task is to grade the student's solution shown in the image(s).
+If there are several images they are consecutive pages of the same solution, in order.
+
+Follow these steps:
+1. First, carefully read and understand what the student has written/solved
+2. Examine the solution in detail, looking at both the process and final answer
+3. Grade based on mathematical accuracy, problem-solving approach, and clarity of work
+
+Grade these criteria: Mathematical Accuracy (out of 20), Problem-Solving Approach (out of 20), Work Clarity (out of 10).
+""" + STRUCTURED_FORMAT_INSTRUCTIONS
+
+def get_image_prompt(structured=False):
+    return IMAGE_GRADING_JSON_PROMPT if structured else IMAGE_GRADING_PROMPT
+
+def grade_image_files(image_files, structured=False, use_cache=True):
     """
-    Prepare images for Gemini model input
+    Grade image submissions with Gemini vision, reusing the cached response
+    for identical images unless use_cache is False
+    """
+    prompt = get_image_prompt(structured)
+    key = None
+    if response_cache:
+        image_bytes = [read_file(file) for file in image_files]
+        key = response_cache.key(VISION_MODEL, PROMPT_VERSION, prompt, image_normalizer.settings(), *image_bytes)
+        cached = response_cache.get(key) if use_cache else None
+        if cached is not None:
+            return cached
+
+    response = get_gemini_response(input_image_setup(image_files), prompt, structured)
+    if key and has_grade(response, structured):
+        response_cache.put(key, response)
+    return response
+
+# Gemini bills an image of up to 768x768 as 258 tokens, larger ones per tile
+IMAGE_TOKENS = 258 * 4
+
+# "alice_page2.jpg", "alice-p3.png" and "alice pg 1.jpg" are all pages of "alice".
+# The page token needs a separator before it, so "step2.jpg", "philip2.jpg"
+# and "alicepage2.jpg" are students of their own
+PAGE_SUFFIX_PATTERN = re.compile(r'(?:^|[\s_-]+)(?:page|pg|p)[\s_-]*\d+$', re.IGNORECASE)
+
+def get_image_student(file_name):
+    """
+    Return the student an image is a page of, or None when its name has no
+    page suffix
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    student = PAGE_SUFFIX_PATTERN.sub('', stem)
+    return student if student and student != stem else None
+
+def group_images(image_files, image_names):
+    """
+    Group image submissions into one entry per student, keeping upload
+    order. Only images with a page suffix on the file name are pages of a
+    student; any other image is a student of its own, even when names
+    repeat, as phones name every camera upload "image.jpg". Repeated
+    student names are numbered, "image", "image (2)", ... Returns
+    [(student, paths, names)]
+    """
+    groups = {}
+    for path, name in zip(image_files, image_names):
+        student = get_image_student(name)
+        # A one-page student gets a key of its own so it is never merged
+        key = ('pages', student) if student else ('image', len(groups))
+        groups.setdefault(key, (student or os.path.splitext(os.path.basename(name))[0], [], []))
+        groups[key][1].append(path)
+        groups[key][2].append(name)
+
+    students = []
+    used = set()
+    for student, paths, names in groups.values():
+        unique, number = student, 1
+        while unique in used:
+            number += 1
+            unique = f"{student} ({number})"
+        used.add(unique)
+        students.append((unique, paths, names))
+    return students
+
+@metrics.timed("image_normalize")
+def input_image_setup(image_files):
+    """
+    Prepare images for Gemini model input as compact JPEG blobs
     """
     image_parts = []
-    for path in image_paths:
-        image = Image.open(path)
-        # Convert to RGB if image is in RGBA format
-        if image.mode == 'RGBA':
-            image = image.convert('RGB')
-        image_parts.append(image)
+    for file, image in zip(image_files, image_normalizer.normalize(source_of(file) for file in image_files)):
+        if image.error:
+            print(f"Error reading image {name_of(file)}: {image.error}")
+            raise ValueError("Could not read image file. The file might be corrupted or not an image.")
+        image_parts.append({'mime_type': image.mime_type, 'data': image.data})
     return image_parts
 
+def preload_llm_clients():
+    """
+    Build every client and chain up front so the first requests don't pay
+    for it. Failures are logged and the clients are built on first use
+    """
+    try:
+        get_rubric_chain()
+        for rubric in (False, True):
+            for structured in (False, True):
+                get_conversational_chain(rubric, structured)
+                get_vision_model(structured)
+    except Exception as e:
+        print(f"Error preloading LLM clients: {str(e)}")
+
+def warm_up():
+    """
+    Import every stage's heavy dependencies and build the LLM clients, so
+    a worker's first request doesn't pay for them
+    """
+    started = time.perf_counter()
+    try:
+        import langchain.chains.question_answering
+        import langchain.docstore.document
+        import langchain.text_splitter
+        import PIL.ImageOps
+        import PyPDF2
+        import plagiarism
+        if vector_indexer.enabled:
+            import vector_index
+            vector_index.load_dependencies()
+    except Exception as e:
+        print(f"Error importing dependencies during warm-up: {str(e)}")
+    preload_llm_clients()
+    print(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+# WARM_UP=startup warms up while the module loads, so workers forked from a
+# preloading master (gunicorn --preload) inherit everything already
+# imported. WARM_UP=fork has each forked worker warm itself up in the
+# background instead, keeping the master small and its start-up fast
+WARM_UP = os.getenv("WARM_UP", "").lower()
+if WARM_UP == "startup":
+    warm_up()
+elif WARM_UP == "fork":
+    os.register_at_fork(after_in_child=lambda: threading.Thread(target=warm_up, daemon=True).start())
+
+if metrics.enabled:
+    # Whole-request latency per endpoint, to compare against its stages
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        if request.endpoint and 'request_started' in g:
+            metrics.observe(f"request_{request.endpoint}", time.perf_counter() - g.request_started)
+        return response
+
 @app.route('/hello', methods=['GET'])
 def hello():
     return jsonify({'message': 'gradify backend baby'})
 
-@app.route('/api/grade/automate', methods=['POST', 'OPTIONS'])
-def grade_files():
+def get_automate_form():
+    """
+    Read the file URLs, rubric URL and question posted to the automate
+    endpoints. Returns the arguments and an error response (one is None)
+    """
+    files = request.form.get('files') or ''
+    file_urls = [url.strip() for url in files.split(',') if url.strip()]
+    rubric_file_url = request.form.get('rubric')
+    question = request.form.get('question')
+
+    if not file_urls:
+        return None, (jsonify({'error': 'No files uploaded'}), 400)
+
+    if not question:
+        return None, (jsonify({'error': 'No question provided'}), 400)
+
+    return (file_urls, rubric_file_url, question), None
+
+def print_token_usage(batch_id, usage):
+    report = usage.to_dict()
+    if report['essays']:
+        print(f"Batch {batch_id}: sent {report['tokens_sent']} essay tokens for {report['essays']} essays, "
+              f"saved {report['tokens_saved']} against overlapping chunks, {report['map_reduce']} graded map-reduce")
+
+class Submission:
+    """
+    One student's work on its way through the grading pipeline: a PDF
+    essay, one or more pages of images, or a URL still to be downloaded
+    """
+
+    def __init__(self, name, kind=None, files=None, url=None):
+        self.name = name
+        self.kind = kind
+        self.files = files or []
+        self.url = url
+        self.text = None
+        self.response = None
+
+def extract_submissions(submissions):
+    """
+    Extract the text of a batch of PDF submissions in one go, so the pages
+    of all of them are spread over the PDF worker processes together
+    """
+    texts = get_pdf_text([submission.files[0] for submission in submissions])
+    for submission in submissions:
+        submission.text = texts[submission.files[0]]
+    return submissions
+
+def run_grading(submissions, load_rubric, question, on_result=None, batch_id=None, assignment_id=None,
+                course_id=None, check_plagiarism=False, structured=False, use_cache=True, pack=False, usage=None,
+                fetch=None):
+    """
+    Grade Submissions through the staged pipeline: [fetch ->] extract ->
+    grade, each stage a worker group behind a bounded queue, so one
+    student's download, another's extraction and a third's LLM call all
+    overlap. load_rubric() runs alongside the first stages and returns the
+    rubric text the grading stage waits for.
+
+    Each result is parsed and saved under batch_id, and on_result(name,
+    response, files, result) called, as soon as that student is graded, so
+    a quick submission never waits behind a slow one. Returns the combined
+    responses in submission order and, if check_plagiarism is set, a
+    plagiarism report for the PDF submissions
+    """
+    rubric = llm_executor.submit(load_rubric)
+
+    def grade(batch):
+        return grade_batch(batch, rubric.result(), question, structured, use_cache, pack, usage)
+
+    stages = []
+    if fetch:
+        stages.append(Stage('fetch', fetch, workers=DOWNLOAD_WORKERS))
+    stages.append(Stage('extract', extract_submissions, workers=PIPELINE_EXTRACT_WORKERS,
+                        batch_size=PIPELINE_EXTRACT_BATCH, when=lambda submission: submission.kind == 'pdf'))
+    if pack:
+        # Essays waiting together on the queue are packed into shared calls
+        stages.append(Stage('grade', grade, workers=PIPELINE_GRADE_WORKERS, batch_size=PACK_MAX_SUBMISSIONS))
+    else:
+        stages.append(Stage('grade', lambda submission: grade([submission])[0], workers=PIPELINE_GRADE_WORKERS))
+
+    batch_id = batch_id or uuid.uuid4().hex
+    assignment_id = get_assignment_id(question or "", assignment_id)
+    usage = usage or TokenUsage()
+    # Students finish in any order; these are put back in submission order
+    # once all of them have
+    responses = {}
+    texts = {}
     try:
-        # Fetch the file URLs from the request body
-        file_urls = request.form.get('files').split(',')
-        rubric_file_url = request.form.get('rubric')
-        question = request.form.get('question')
-        
-        if not file_urls:
-            return jsonify({'error': 'No files uploaded'}), 400
-        
-        if not question:
-            return jsonify({'error': 'No question provided'}), 400
-        
-        # Temporary storage for downloaded files
-        temp_files = []
-        pdf_files = []
-        image_files = []
-        pdf_names = []
-        image_names = []
-        
-        # Download files from the provided URLs
-        i = 0
-        for file_url in file_urls:
-            file_response = requests.get(file_url, stream=True)
-            if file_response.status_code == 200:
-                file_name = "student" + (str)(i) + ".pdf"
-                if file_name.endswith('.pdf'):
-                    with tempfile.NamedTemporaryFile(delete=False) as temp_pdf:
-                        for chunk in file_response.iter_content(chunk_size=1024):
-                            if chunk:
-                                temp_pdf.write(chunk)
-                        temp_files.append(temp_pdf.name)
-                        pdf_files.append(temp_pdf.name)
-                        pdf_names.append(file_name)
-                elif file_name.endswith(('.png', '.jpg', '.jpeg')):
-                    with tempfile.NamedTemporaryFile(delete=False) as temp_image:
-                        for chunk in file_response.iter_content(chunk_size=1024):
-                            if chunk:
-                                temp_image.write(chunk)
-                        temp_files.append(temp_image.name)
-                        image_files.append(temp_image.name)
-                        image_names.append(file_name)
-                else:
-                    return jsonify({'error': 'Unsupported file type uploaded'}), 400
-                i += 1
-            else:
-                return jsonify({'error': f'Failed to download file from {file_url}'}), 400
-        
-        # Process rubric file
-        rubric_file_response = requests.get(rubric_file_url, stream=True)
-        if rubric_file_response.status_code == 200:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_rubric:
-                for chunk in rubric_file_response.iter_content(chunk_size=1024):
-                    if chunk:
-                        temp_rubric.write(chunk)
-                rubric_text = get_pdf_text([temp_rubric.name])  # Get rubric text from PDF
-                temp_rubric.close()
-        else:
-            return jsonify({'error': f'Failed to download rubric file from {rubric_file_url}'}), 400
-        
-        # Prepare images for Gemini model if any images are uploaded
-        all_images = input_image_setup(image_files) if image_files else []
+        pipeline = Pipeline(stages, queue_size=PIPELINE_QUEUE_SIZE, name='grading')
+        for position, submission in pipeline.as_completed(submissions):
+            # Essays keep their text and rubric so they can be regraded cheaply
+            rubric_text = rubric.result() if submission.kind == 'pdf' else None
+            output_text, result = record_result(batch_id, submission.name, submission.response, structured, rubric_text,
+                                                assignment_id, course_id)
+            responses[position] = f"\nResponse for {submission.name}: \n\n" + output_text
+            if submission.kind == 'pdf':
+                index_submission(assignment_id, submission.name, submission.text)
+                if not submission.text.startswith("Error:"):
+                    texts[position] = (submission.name, submission.text)
+                    if rubric_text and "rubric_version" in result:
+                        result_store.put_rubric(result["rubric_version"], rubric_text)
+                        result_store.put_source(batch_id, submission.name, {"text": submission.text, "question": question})
+            if on_result:
+                on_result(submission.name, output_text, len(submission.files), result)
+        # Surfaces a rubric error even when there was nothing to grade
+        rubric.result()
+    finally:
+        # Don't return while the rubric is still being fetched or read
+        if not rubric.cancel():
+            rubric.exception()
 
-        # Initialize response holder
-        raw_text = get_pdf_text(pdf_files)
-        responses = ""
-        
-        # Process PDF files
-        for key, value in raw_text.items():
-            text_chunks = get_text_chunks(value)
-            get_vector_store(text_chunks)
-            rubric_text = get_pdf_text([temp_rubric.name]) if temp_rubric.name else None
+    plagiarism = None
+    if check_plagiarism:
+        from plagiarism import plagiarism_report
+        with metrics.time("plagiarism"):
+            plagiarism = plagiarism_report(dict(texts[position] for position in sorted(texts)))
 
-            if rubric_text:
-                for rubric_key in rubric_text:
-                    rubric_str = rubric_text[rubric_key]
+    print_token_usage(batch_id, usage)
+    return "".join(responses[position] for position in sorted(responses)), plagiarism
 
-                rubric_chain = get_rubric_chain()
+def grade_submissions(pdf_files, pdf_names, image_files, image_names, rubric_file, question, **options):
+    """
+    Grade PDF and image submissions, Uploads or file paths, against the
+    rubric (None for image-only batches) with run_grading(**options).
+    A student's image pages are graded together in one vision call
+    """
+    submissions = [Submission(name, 'pdf', [file]) for file, name in zip(pdf_files, pdf_names)]
+    submissions += [Submission(student, 'image', files) for student, files, _ in group_images(image_files, image_names)]
+    return run_grading(submissions, lambda: get_rubric_summary(rubric_file) if rubric_file else None, question, **options)
 
-                response = rubric_chain({"input_documents": convert_text_to_documents([rubric_str])}, return_only_outputs=True)
-                rubric_text = response["output_text"]
-            
-            chain = get_conversational_chain(rubric=rubric_text)
-            
-            documents = convert_text_to_documents(text_chunks)
-            
-            response = chain({"input_documents": documents, "rubric": rubric_text, "question": question}, return_only_outputs=True)
-            responses += f"\nResponse for {pdf_names[pdf_files.index(key)]}: \n\n" + response['output_text']
-            
-            print(response["output_text"])
-            create_visualizations(response["output_text"])
-            extract_criteria_and_values(response["output_text"])
-            
-        
-        # Process image files if any images are uploaded
-        if all_images:
-            input_prompt = """
-            You are an expert grader. Your task is to grade the student's solution shown in the image.
-            
-            Follow these steps:
-            1. First, carefully read and understand what the student has written/solved
-            2. Examine the solution in detail, looking at both the process and final answer
-            3. Grade based on mathematical accuracy, problem-solving approach, and clarity of work
-            4. Provide specific feedback on what was done well and what could be improved
-            
-            Use exactly this format:
-            
-            Student's Solution Analysis:
-            [Brief analysis of the student's work and approach]
-            
-            Grading:
-            • Mathematical Accuracy: score/20
-              [Brief explanation of score]
-            • Problem-Solving Approach: score/20
-              [Brief explanation of score]
-            • Work Clarity: score/10
-              [Brief explanation of score]
-            
-            Total Percentage Grade: [X]%
-            Letter Grade: [X]
-            
-            Feedback:
-            [2-3 sentences of constructive feedback]
-            """
-            
-            # Get response from Gemini for the images
-            response = get_gemini_response(all_images, input_prompt)
-            
-            # Process image grading response
-            responses += "\nResponse for images: \n\n" + response
-            create_visualizations(response)
-            extract_criteria_and_values(response)
+def grade_file_urls(file_urls, rubric_file_url, question, **options):
+    """
+    Download and grade every submission in file_urls against the rubric
+    at rubric_file_url with run_grading(**options); downloads overlap
+    grading. Raises ValueError when a file cannot be downloaded or is not
+    a PDF or image
+    """
+    # Temporary storage for downloaded files
+    temp_files = []
 
-        # Clean up temporary files
+    def load_rubric():
+        download = downloader.fetch(rubric_file_url)
+        temp_files.append(download.path)
+        if download.kind != 'pdf':
+            raise ValueError(f'Rubric file from {rubric_file_url} is not a PDF')
+        return get_rubric_summary(download.path)
+
+    def fetch(submission):
+        with metrics.time("download"):
+            download = downloader.fetch(submission.url)
+        temp_files.append(download.path)
+        if download.kind not in ('pdf', 'image'):
+            raise ValueError(f'Unsupported file type downloaded from {download.url}')
+        submission.kind = download.kind
+        submission.files = [download.path]
+        submission.name += download.extension or ""
+        return submission
+
+    try:
+        submissions = [Submission("student" + str(i), url=url) for i, url in enumerate(file_urls)]
+        return run_grading(submissions, load_rubric, question, fetch=fetch, **options)
+    finally:
+        # Clean up temporary files; the pipeline has stopped writing them
         for temp_file in temp_files:
             os.unlink(temp_file)
-        print(responses)
-        return jsonify({
+
+REGRADE_PROMPT = """
+    You are a trained expert on writing and literary analysis. The rubric for this student's essay has changed. Grade the essay again on only these criteria of the updated rubric:
+{criteria}
+
+    These criteria are unchanged and keep the scores already given:
+{kept}
+
+    The full updated rubric, for context:
+{rubric}
+
+    For each criteria to grade, provide a brief comment (1-2 lines) explaining the score. Then give the overall percentage and letter grade for the whole essay under the updated rubric, counting the kept scores as given. Be lenient, keep in mind that the student is still learning, and consider the writing expected at their course and grade level.
+{format}
+        Essay:\n {text}\n
+        Question: \n{question}\n
+    """
+
+def get_regrade_output(text, rubric_text, question, criteria, kept=(), use_cache=True):
+    """
+    Ask the grading model for just the given criteria of rubric_text and
+    the overall grade, given the kept criteria results, reusing a cached
+    response. Essays too long for one call are regraded from per-part
+    notes, like grade_essay does
+    """
+    kept = "\n".join(f"    - {item['criteria']}: {item['scored']}/{item['total']}" for item in kept) or "    (none)"
+    key = None
+    if response_cache:
+        key = response_cache.key(GRADING_MODEL, PROMPT_VERSION, "regrade", rubric_text, "\n".join(criteria), kept,
+                                 question, text)
+        cached = response_cache.get(key) if use_cache else None
+        if cached is not None:
+            return cached
+
+    budget = get_essay_budget(rubric_text, question)
+    if count_tokens(text) > budget:
+        text = ESSAY_NOTES_HEADER + "\n\n".join(get_essay_notes(text, rubric_text, question, budget))
+    prompt = REGRADE_PROMPT.format(criteria="\n".join(f"    - {name}" for name in criteria) or "    (none)", kept=kept,
+                                   rubric=rubric_text, format=REGRADE_FORMAT_INSTRUCTIONS, text=text, question=question)
+    output_text = call_llm("regrade", get_chat_model(GRADING_MODEL).invoke, prompt, tokens=count_tokens(prompt)).content
+    if key:
+        try:
+            parse_criteria_grades(output_text, criteria)
+        except ValueError:
+            return output_text
+        response_cache.put(key, output_text)
+    return output_text
+
+def regrade_result(result, source, rubric_text, batch_id, use_cache=True):
+    """
+    Regrade one stored essay result against rubric_text and save the new
+    result under batch_id. Criteria whose rubric line is unchanged keep
+    their score; only changed and new ones go to the model, and removed
+    ones are dropped. Whenever the criteria change, the model also gives
+    the overall grade again on the original grading basis; only if it
+    doesn't is the overall recomputed from the raw scores. Returns the
+    response text, the new result, the names of the criteria that were
+    regraded and how the overall grade was arrived at: "kept", "model" or
+    "recomputed"
+    """
+    versions = criteria_versions(rubric_text)
+    if not versions:
+        # Nothing to diff against, so grade the cached text in full
+        output_text = grade_essay(source["text"], rubric_text, source["question"], True, use_cache)
+        output_text, new_result = record_result(batch_id, result["name"], output_text, True, rubric_text,
+                                            result.get("assignment_id"), result.get("course_id"))
+        new_result["regraded_from"] = result["id"]
+        result_store.put(new_result)
+        return output_text, new_result, [item["criteria"] for item in new_result["criteria"]], "model"
+
+    kept = {}
+    for item in result["criteria"]:
+        key = match_criterion(item["criteria"], versions)
+        if key and item.get("version") == versions[key][1]:
+            kept[key] = item
+    stale = [name for key, (name, _) in versions.items() if key not in kept]
+
+    regraded = {}
+    feedback = ""
+    overall = "kept"
+    percentage_grade, letter_grade = result["percentage_grade"], result["letter_grade"]
+    if stale or len(kept) < len(result["criteria"]):
+        # Removing a criteria changes the overall grade too, even with nothing to regrade
+        kept_criteria = [kept[key] for key in versions if key in kept]
+        output_text = get_regrade_output(source["text"], rubric_text, source["question"], stale, kept_criteria,
+                                         use_cache)
+        grades, model_overall, feedback = parse_criteria_grades(output_text, stale)
+        for name, grade in zip(stale, grades):
+            key = normalize_name(name)
+            regraded[key] = {"criteria": name, "scored": grade["score"], "total": grade["total"],
+                             "comment": grade["comment"], "version": versions[key][1]}
+        if model_overall:
+            overall = "model"
+            percentage_grade, letter_grade = model_overall
+        else:
+            overall = "recomputed"
+            print(f"Regrade response for {result['name']} has no overall grade, using the raw score ratio")
+
+    criteria = [kept.get(key) or regraded[key] for key in versions]
+    if overall == "recomputed":
+        percentage_grade, letter_grade = score_criteria(criteria)
+
+    output_text = render_grade({
+        "criteria": [{"name": item["criteria"], "score": item["scored"], "total": item["total"],
+                      "comment": item.get("comment", "")} for item in criteria],
+        "percentage": percentage_grade,
+        "letter": letter_grade,
+        "feedback": feedback
+    })
+    new_result = {
+        "id": uuid.uuid4().hex,
+        "batch_id": batch_id,
+        "assignment_id": result.get("assignment_id"),
+        "course_id": result.get("course_id"),
+        "name": result["name"],
+        "criteria": criteria,
+        "percentage_grade": percentage_grade,
+        "letter_grade": letter_grade,
+        "error": None,
+        "rubric_version": rubric_version(rubric_text),
+        "regraded_from": result["id"],
+        "created_at": time.time()
+    }
+    if overall == "recomputed":
+        new_result["overall_recomputed"] = True
+    result_store.put(new_result, output_text)
+    return output_text, new_result, stale, overall
+
+def regrade_batch(batch_id, rubric_text, use_cache=True):
+    """
+    Regrade the essays of a graded batch against an edited rubric from
+    their stored text, re-running only the criteria the edit touched (see
+    regrade_result). Returns the new batch's id, the rubric diff and one
+    entry per student; students without a stored text, such as image
+    submissions, are listed as skipped. Raises ValueError if the batch
+    has nothing to regrade
+    """
+    results = [result for result in result_store.get_batch(batch_id) if result.get("rubric_version")]
+    if not results:
+        raise ValueError(f'Batch {batch_id} has no essays graded against a stored rubric')
+    new_batch_id = uuid.uuid4().hex
+    result_store.put_rubric(rubric_version(rubric_text), rubric_text)
+    old_rubric = result_store.get_rubric(results[0]["rubric_version"]) or ""
+
+    def regrade(result):
+        source = result_store.get_source(batch_id, result["name"])
+        if source is None:
+            return {"name": result["name"], "skipped": "no stored text to regrade from"}
+        try:
+            output_text, new_result, stale, overall = regrade_result(result, source, rubric_text, new_batch_id,
+                                                                     use_cache)
+        except Exception as e:
+            print(f"Regrading failed for {result['name']}: {str(e)}")
+            return {"name": result["name"], "error": str(e) or type(e).__name__}
+        result_store.put_source(new_batch_id, result["name"], source)
+        return {"name": result["name"], "result_id": new_result["id"], "regraded": stale,
+                "kept": len(new_result["criteria"]) - len(stale), "overall": overall, "response": output_text}
+
+    entries = list(map_ordered(llm_executor, regrade, results))
+    return new_batch_id, diff_rubrics(old_rubric, rubric_text), entries
+
+def get_grading_options():
+    """
+    Per-request grading options shared by the grading endpoints
+    """
+    return {
+        'assignment_id': request.form.get('assignment'),
+        'course_id': request.form.get('course'),
+        'check_plagiarism': is_enabled(request.form.get('plagiarism')),
+        'structured': use_structured_output(request.form.get('output')),
+        'use_cache': not cache_bypassed(),
+        'pack': is_enabled(request.form.get('pack') or str(PACKED_GRADING))
+    }
+
+def save_uploaded_files():
+    """
+    Buffer the uploaded 'pdf' and 'image' files and the rubric as Uploads.
+    Returns (uploads, pdf_files, pdf_names, image_files, image_names,
+    rubric_file); the caller closes uploads once grading is done. Raises
+    ValueError for other file types
+    """
+    files = request.files.getlist('pdf') + request.files.getlist('image')
+    rubric_file = request.files.get('rubric')
+
+    uploads = Uploads(UPLOAD_MEMORY_BYTES, UPLOAD_REQUEST_MEMORY_BYTES)
+    pdf_files = []
+    image_files = []
+    pdf_names = []
+    image_names = []
+
+    try:
+        # Separate the files into PDFs and images
+        for file in files:
+            if file.filename.endswith('.pdf'):
+                pdf_files.append(uploads.add(file))
+                pdf_names.append(file.filename)
+            elif file.filename.endswith(('.png', '.jpg', '.jpeg')):
+                image_files.append(uploads.add(file))
+                image_names.append(file.filename)
+            else:
+                raise ValueError('Unsupported file type uploaded')
+
+        if rubric_file is None:
+            raise ValueError('No rubric file uploaded')
+        rubric = uploads.add(rubric_file)
+    except Exception:
+        uploads.close()
+        raise
+
+    return uploads, pdf_files, pdf_names, image_files, image_names, rubric
+
+@app.route('/api/grade/automate', methods=['POST', 'OPTIONS'])
+def grade_files():
+    try:
+        args, error = get_automate_form()
+        if error:
+            return error
+
+        batch_id = uuid.uuid4().hex
+        usage = TokenUsage()
+        responses, plagiarism = grade_file_urls(*args, batch_id=batch_id, usage=usage, **get_grading_options())
+        output = {
             'status': 'success',
-            'response': responses
-        })
+            'batch_id': batch_id,
+            'response': responses,
+            'tokens': usage.to_dict()
+        }
+        if plagiarism is not None:
+            output['plagiarism'] = plagiarism
+        return jsonify(output)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/api/grade/automate/stream', methods=['POST', 'OPTIONS'])
+def stream_grade_files():
+    try:
+        args, error = get_automate_form()
+        if error:
+            return error
+
+        return stream_grading(
+            grade_file_urls, *args,
+            batch_id=uuid.uuid4().hex,
+            total=len(args[0]),
+            stream_format=request.form.get('format', 'sse'),
+            **get_grading_options()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def submit_grading_job():
+    try:
+        args, error = get_automate_form()
+        if error:
+            return error
+
+        batch_id = uuid.uuid4().hex
+        job = job_manager.submit(
+            grade_file_urls, *args,
+            batch_id=batch_id,
+            total=len(args[0]),
+            meta={'batch_id': batch_id},
+            **get_grading_options()
+        )
+        return jsonify({
+            'status': job.status,
+            'job_id': job.id,
+            'batch_id': batch_id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_grading_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    status = job.to_dict()
+    # grade_file_urls returns (responses, plagiarism report)
+    if job.output and job.output[1] is not None:
+        status['plagiarism'] = job.output[1]
+    return jsonify(status)
     
 @app.route('/api/grade/image', methods=['POST', 'OPTIONS'])
 def grade_image():
@@ -386,63 +1376,38 @@ def grade_image():
             return jsonify({'error': 'No Image file uploaded'}), 400
         
         answer_files = request.files.getlist('image')
-        temp_images = []
-        image_names = []
-        
-        # Save answer images temporarily
-        for image in answer_files:
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_image:
-                image.save(temp_image.name)
-                temp_images.append(temp_image.name)
-                image_names.append(image.filename)
-                temp_image.close()
-            
-        input_prompt = """
-        You are an expert grader. Your task is to grade the student's solution shown in the image.
-        
-        Follow these steps:
-        1. First, carefully read and understand what the student has written/solved
-        2. Examine the solution in detail, looking at both the process and final answer
-        3. Grade based on mathematical accuracy, problem-solving approach, and clarity of work
-        4. Provide specific feedback on what was done well and what could be improved
-        
-        Use exactly this format:
-        
-        Student's Solution Analysis:
-        [Brief analysis of the student's work and approach]
-        
-        Grading:
-        • Mathematical Accuracy: score/20
-          [Brief explanation of score]
-        • Problem-Solving Approach: score/20
-          [Brief explanation of score]
-        • Work Clarity: score/10
-          [Brief explanation of score]
-        
-        Total Percentage Grade: [X]%
-        Letter Grade: [X]
-        
-        Feedback:
-        [2-3 sentences of constructive feedback]
-        """
-        
-        # Prepare images for Gemini
-        all_images = input_image_setup(temp_images)
-        
-        # Get response from Gemini
-        response = get_gemini_response(all_images, input_prompt)
-        
-        # Process response for visualization
-        create_visualizations(response)
-        extract_criteria_and_values(response)
-            
-        # Clean up temporary files
-        for temp in temp_images:
-            os.unlink(temp)
-        
+        batch_id = uuid.uuid4().hex
+        results = []
+
+        def on_result(name, response, files, result):
+            results.append({'name': name, 'files': pages[name], 'response': response})
+
+        # Answer images are buffered in memory and released however this ends
+        with Uploads(UPLOAD_MEMORY_BYTES, UPLOAD_REQUEST_MEMORY_BYTES) as uploads:
+            images = [uploads.add(image) for image in answer_files]
+            image_names = [image.filename for image in answer_files]
+            pages = {student: names for student, _, names in group_images(images, image_names)}
+
+            # One vision call per student, without a rubric or question
+            grade_submissions([], [], images, image_names, None, None, on_result=on_result, batch_id=batch_id,
+                              structured=use_structured_output(request.form.get('output')),
+                              use_cache=not cache_bypassed())
+
+        # Students are reported as they finish; list them in upload order
+        order = list(pages)
+        results.sort(key=lambda result: order.index(result['name']))
+
+        # A single student keeps the plain response the client has always received
+        if len(results) == 1:
+            response = results[0]['response']
+        else:
+            response = "".join(f"\nResponse for {result['name']}: \n\n" + result['response'] for result in results)
+
         return jsonify({
             'status': 'success',
-            'response': response
+            'batch_id': batch_id,
+            'response': response,
+            'results': results
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -460,55 +1425,25 @@ def grade_pdf():
         if not question:
             return jsonify({'error': 'No question provided'}), 400
 
-        temp_pdfs = []
-        pdf_names = []
-
-        for pdf in pdf_file:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_pdf:
-                pdf.save(temp_pdf.name)
-                temp_pdfs.append(temp_pdf.name)
-                pdf_names.append(pdf.filename)
-                temp_pdf.close()
-        
-        with tempfile.NamedTemporaryFile(delete=False) as temp_rubric:
-            rubric_file.save(temp_rubric.name)
-            temp_rubric.close()
-            
-        raw_text = get_pdf_text(temp_pdfs)
-        responses = ""
-
-        for key, value in raw_text.items():
-            text_chunks = get_text_chunks(value)
-            get_vector_store(text_chunks)
-            rubric_text = get_pdf_text([temp_rubric.name]) if temp_rubric.name else None
-
-            if rubric_text:
-                for rubric_key in rubric_text:
-                    rubric_str = rubric_text[rubric_key]
+        batch_id = uuid.uuid4().hex
+        usage = TokenUsage()
 
-                rubric_chain = get_rubric_chain()
+        # Uploads are read straight from memory and released however this ends
+        with Uploads(UPLOAD_MEMORY_BYTES, UPLOAD_REQUEST_MEMORY_BYTES) as uploads:
+            pdfs = [uploads.add(pdf) for pdf in pdf_file]
+            rubric = uploads.add(rubric_file)
+            responses, plagiarism = grade_submissions(pdfs, [pdf.filename for pdf in pdf_file], [], [], rubric, question,
+                                                      batch_id=batch_id, usage=usage, **get_grading_options())
 
-                response = rubric_chain({"input_documents": convert_text_to_documents([rubric_str])}, return_only_outputs=True)
-                rubric_text = response["output_text"]
-            
-            chain = get_conversational_chain(rubric=rubric_text)
-            
-            documents = convert_text_to_documents(text_chunks)
-            
-            response = chain({"input_documents": documents, "rubric": rubric_text, "question": question}, return_only_outputs=True)
-            responses += f"\nResponse for {pdf_names[temp_pdfs.index(key)]}: \n\n" + response['output_text']
-            
-            create_visualizations(response["output_text"])
-            extract_criteria_and_values(response["output_text"])
-        
-        for temp in temp_pdfs:
-            os.unlink(temp)
-        os.unlink(temp_rubric.name)
-        
-        return jsonify({
+        output = {
             'status': 'success',
-            'response': responses
-        })
+            'batch_id': batch_id,
+            'response': responses,
+            'tokens': usage.to_dict()
+        }
+        if plagiarism is not None:
+            output['plagiarism'] = plagiarism
+        return jsonify(output)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -518,136 +1453,246 @@ def grade_mixed_files():
         if 'pdf' not in request.files and 'image' not in request.files:
             return jsonify({'error': 'No files uploaded'}), 400
         
-        files = request.files.getlist('pdf') + request.files.getlist('image')
-        rubric_file = request.files.get('rubric')
         question = request.form.get('question')
         
         if not question:
             return jsonify({'error': 'No question provided'}), 400
         
-        temp_files = []
-        pdf_files = []
-        image_files = []
-        pdf_names = []
-        image_names = []
+        uploads, *submissions = save_uploaded_files()
+        with uploads:
+            batch_id = uuid.uuid4().hex
+            usage = TokenUsage()
+            responses, plagiarism = grade_submissions(*submissions, question, batch_id=batch_id, usage=usage,
+                                                      **get_grading_options())
         
-        # Separate the files into PDFs and images
-        for file in files:
-            if file.filename.endswith('.pdf'):
-                with tempfile.NamedTemporaryFile(delete=False) as temp_pdf:
-                    file.save(temp_pdf.name)
-                    temp_files.append(temp_pdf.name)
-                    pdf_files.append(temp_pdf.name)
-                    pdf_names.append(file.filename)
-            elif file.filename.endswith(('.png', '.jpg', '.jpeg')):
-                with tempfile.NamedTemporaryFile(delete=False) as temp_image:
-                    file.save(temp_image.name)
-                    temp_files.append(temp_image.name)
-                    image_files.append(temp_image.name)
-                    image_names.append(file.filename)
-            else:
-                return jsonify({'error': 'Unsupported file type uploaded'}), 400
-        
-        # Process rubric file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_rubric:
-            rubric_file.save(temp_rubric.name)
-            rubric_text = get_pdf_text([temp_rubric.name])  # Get rubric text from PDF
-            temp_rubric.close()
-        
-        # Prepare images for Gemini model if any images are uploaded
-        all_images = input_image_setup(image_files) if image_files else []
+        output = {
+            'status': 'success',
+            'batch_id': batch_id,
+            'response': responses,
+            'tokens': usage.to_dict()
+        }
+        if plagiarism is not None:
+            output['plagiarism'] = plagiarism
+        return jsonify(output)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Initialize response holder
-        raw_text = get_pdf_text(pdf_files)
-        responses = ""
 
-        # Process PDF files
-        for key, value in raw_text.items():
-            text_chunks = get_text_chunks(value)
-            get_vector_store(text_chunks)
-            rubric_text = get_pdf_text([temp_rubric.name]) if temp_rubric.name else None
+@app.route('/api/grade/stream', methods=['POST', 'OPTIONS'])
+def stream_grade_mixed_files():
+    try:
+        if 'pdf' not in request.files and 'image' not in request.files:
+            return jsonify({'error': 'No files uploaded'}), 400
 
-            if rubric_text:
-                for rubric_key in rubric_text:
-                    rubric_str = rubric_text[rubric_key]
+        question = request.form.get('question')
 
-                rubric_chain = get_rubric_chain()
+        if not question:
+            return jsonify({'error': 'No question provided'}), 400
 
-                response = rubric_chain({"input_documents": convert_text_to_documents([rubric_str])}, return_only_outputs=True)
-                rubric_text = response["output_text"]
-            
-            chain = get_conversational_chain(rubric=rubric_text)
-            
-            documents = convert_text_to_documents(text_chunks)
-            
-            response = chain({"input_documents": documents, "rubric": rubric_text, "question": question}, return_only_outputs=True)
-            responses += f"\nResponse for {pdf_names[pdf_files.index(key)]}: \n\n" + response['output_text']
-            
-            create_visualizations(response["output_text"])
-            extract_criteria_and_values(response["output_text"])
-        
-        # Process image files if any images are uploaded
-        if all_images:
-            input_prompt = """
-            You are an expert grader. Your task is to grade the student's solution shown in the image.
-            
-            Follow these steps:
-            1. First, carefully read and understand what the student has written/solved
-            2. Examine the solution in detail, looking at both the process and final answer
-            3. Grade based on mathematical accuracy, problem-solving approach, and clarity of work
-            4. Provide specific feedback on what was done well and what could be improved
-            
-            Use exactly this format:
-            
-            Student's Solution Analysis:
-            [Brief analysis of the student's work and approach]
-            
-            Grading:
-            • Mathematical Accuracy: score/20
-              [Brief explanation of score]
-            • Problem-Solving Approach: score/20
-              [Brief explanation of score]
-            • Work Clarity: score/10
-              [Brief explanation of score]
-            
-            Total Percentage Grade: [X]%
-            Letter Grade: [X]
-            
-            Feedback:
-            [2-3 sentences of constructive feedback]
-            """
-            
-            # Get response from Gemini for the images
-            response = get_gemini_response(all_images, input_prompt)
-            
-            # Process image grading response
-            responses += "\nResponse for images: \n\n" + response
-            create_visualizations(response)
-            extract_criteria_and_values(response)
+        stream_format = request.form.get('format', 'sse')
+        options = get_grading_options()
+        uploads, *submissions = save_uploaded_files()
 
-        # Clean up temporary files
-        for temp_file in temp_files:
-            os.unlink(temp_file)
-        
+        try:
+            return stream_grading(
+                grade_submissions, *submissions, question,
+                batch_id=uuid.uuid4().hex,
+                total=len(submissions[0]) + len(submissions[2]),
+                stream_format=stream_format,
+                cleanup=uploads.close,
+                **options
+            )
+        except Exception:
+            uploads.close()
+            raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/regrade', methods=['POST', 'OPTIONS'])
+def regrade_files():
+    try:
+        batch_id = request.form.get('batch_id')
+        if not batch_id:
+            return jsonify({'error': 'No batch_id provided'}), 400
+
+        # The edited rubric comes as a new PDF or as edited summary text
+        rubric_text = request.form.get('rubric_text')
+        if not rubric_text:
+            if 'rubric' not in request.files:
+                return jsonify({'error': 'No rubric file or rubric_text provided'}), 400
+            with Uploads(UPLOAD_MEMORY_BYTES, UPLOAD_REQUEST_MEMORY_BYTES) as uploads:
+                rubric_text = get_rubric_summary(uploads.add(request.files['rubric']))
+
+        new_batch_id, diff, entries = regrade_batch(batch_id, rubric_text, not cache_bypassed())
+        graded = [entry for entry in entries if 'result_id' in entry]
         return jsonify({
             'status': 'success',
-            'response': responses
+            'batch_id': new_batch_id,
+            'regraded_from': batch_id,
+            'diff': diff,
+            'criteria_regraded': sum(len(entry['regraded']) for entry in graded),
+            'criteria_kept': sum(entry['kept'] for entry in graded),
+            # Overall grades the model didn't give, recomputed from the raw scores instead
+            'overall_recomputed': sum(entry['overall'] == 'recomputed' for entry in graded),
+            'response': "".join(f"\nResponse for {entry['name']}: \n\n" + entry['response'] for entry in graded),
+            'results': entries
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/plagiarism', methods=['POST', 'OPTIONS'])
+def check_plagiarism():
+    try:
+        if 'pdf' not in request.files:
+            return jsonify({'error': 'No PDF file uploaded'}), 400
+
+        pdf_files = request.files.getlist('pdf')
+        threshold = float(request.form.get('threshold', 0.5))
+
+        from plagiarism import plagiarism_report
+        results = pdf_extractor.extract([pdf.read() for pdf in pdf_files])
+        texts = {
+            pdf.filename: result.text
+            for pdf, result in zip(pdf_files, results)
+            if not result.error
+        }
 
-@app.route('/api/visualization', methods=['POST', 'OPTIONS'])
-def visualization_pdf():
-    try:       
-        # Use jsonify instead of json.dumps to ensure proper content type
         return jsonify({
-            "criteria": visualization_data, 
-            "percentage_grade": percentage_grade, 
-            "letter_grade": letter_grade
+            'status': 'success',
+            **plagiarism_report(texts, threshold=threshold)
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled, set METRICS_ENABLED=1'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/rubric-cache', methods=['GET'])
+def rubric_cache_stats():
+    return jsonify(rubric_cache.stats())
+
+@app.route('/api/llm-registry', methods=['GET'])
+def llm_registry_stats():
+    return jsonify(llm_registry.stats())
+
+@app.route('/api/llm-calls', methods=['GET'])
+def llm_call_stats():
+    return jsonify(llm_policy.stats())
+
+@app.route('/api/llm-cache', methods=['GET'])
+def llm_cache_stats():
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **response_cache.stats()})
+
+@app.route('/api/results', methods=['GET'])
+def query_results():
+    """
+    Page through saved results, filtered by course, assignment (or its
+    question), batch, student, letter grade and a percentage range on one
+    criteria or the overall grade, e.g.
+    /api/results?assignment=hw1&criteria=Thesis&below=70. Pass the
+    returned next_cursor as cursor for the next page and count=1 for the
+    total number of matches
+    """
+    args = request.args
+    assignment, question = args.get('assignment'), args.get('question')
+    try:
+        limit = min(max(int(args.get('limit') or RESULTS_PAGE_SIZE), 1), RESULTS_PAGE_MAX)
+        below = float(args['below']) if args.get('below') else None
+        at_least = float(args['at_least']) if args.get('at_least') else None
+        page = result_store.query(
+            course_id=args.get('course') or None,
+            assignment_id=get_assignment_id(question or "", assignment) if assignment or question else None,
+            batch_id=args.get('batch_id') or None,
+            student=args.get('student') or None,
+            letter=args.get('letter') or None,
+            criteria=args.get('criteria') or None,
+            below=below,
+            at_least=at_least,
+            include_superseded=is_enabled(args.get('include_superseded')),
+            limit=limit,
+            cursor=args.get('cursor') or None,
+            count=is_enabled(args.get('count'))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@app.route('/api/export', methods=['GET'])
+def export_grades():
+    """
+    Stream the per-criteria grades of an assignment or batch as CSV,
+    Parquet or an Arrow IPC stream. Rows are read from the result store a
+    page at a time and sent as they are encoded, so a large class is never
+    held in memory. Results replaced by a regrade are left out unless
+    include_superseded is set. Without RESULT_DB only the results still in
+    memory are exported
+    """
+    assignment = request.args.get('assignment') or request.args.get('assignment_id')
+    question = request.args.get('question')
+    batch_id = request.args.get('batch_id')
+    export_format = (request.args.get('format') or 'csv').lower()
+    if not (assignment or question or batch_id):
+        return jsonify({'error': 'Provide an assignment, question or batch_id to export'}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+
+    # Assignments graded without an id are keyed by their question
+    assignment_id = get_assignment_id(question or "", assignment) if assignment or question else None
+    try:
+        results = result_store.iter_results(batch_id, assignment_id,
+                                            include_superseded=is_enabled(request.args.get('include_superseded')))
+        chunks = export_chunks(results, export_format, EXPORT_CHUNK_ROWS)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"grades-{assignment_id or batch_id}.{extension}"
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/visualization', methods=['GET', 'POST', 'OPTIONS'])
+def visualization_pdf():
+    try:
+        # Results can be looked up by id or batch id from the query string,
+        # form or JSON body; without either the most recent result is returned
+        params = dict(request.args)
+        params.update(request.form)
+        params.update(request.get_json(silent=True) or {})
+        result_id = params.get('id')
+        batch_id = params.get('batch_id')
+
+        if batch_id:
+            return jsonify({"batch_id": batch_id, "results": result_store.get_batch(batch_id)})
+
+        result = result_store.get(result_id) if result_id else result_store.latest()
+        if result is None:
+            if result_id:
+                return jsonify({'error': 'Result not found'}), 404
+            result = {"criteria": [], "percentage_grade": None, "letter_grade": None}
+
+        # Use jsonify instead of json.dumps to ensure proper content type
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # PDF workers re-run the main script before their first task unless it
+    # is marked as main-only code. They only need extraction, so don't let
+    # each of them build a second copy of the server
+    sys.modules['__main__'].__spec__ = importlib.util.spec_from_loader('__main__', None)
     app.run(debug=True, port=8080)
\ No newline at end of file
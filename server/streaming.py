@@ -0,0 +1,71 @@
+import json
+import queue
+import threading
+
+from flask import Response
+
+MIMETYPES = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def format_event(event, data, stream_format='sse'):
+    if stream_format == 'ndjson':
+        return json.dumps({'event': event, **data}) + '\n'
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_grading(fn, *args, total=0, batch_id=None, stream_format='sse', cleanup=None, **kwargs):
+    """
+    Run a grading function on a background thread and stream its results.
+
+    fn is called as fn(*args, on_result=callback, batch_id=batch_id,
+    **kwargs) like a job, and every callback(name, response, files, result)
+    is sent to the client as a 'result' event followed by a 'progress'
+    event. The stream ends with a
+    'done' event (carrying any plagiarism report) or an 'error' event.
+    cleanup() runs on the worker thread once grading has finished.
+    """
+    if stream_format not in MIMETYPES:
+        raise ValueError(f'Unknown stream format: {stream_format}')
+
+    events = queue.Queue()
+
+    def on_result(name, response, files=1, result=None):
+        events.put(('result', {'name': name, 'response': response, 'files': files, 'result': result}))
+
+    def run():
+        try:
+            _, plagiarism = fn(*args, on_result=on_result, batch_id=batch_id, **kwargs)
+            done = {'batch_id': batch_id}
+            if plagiarism is not None:
+                done['plagiarism'] = plagiarism
+            events.put(('done', done))
+        except Exception as e:
+            events.put(('error', {'error': str(e)}))
+        finally:
+            if cleanup:
+                cleanup()
+            events.put(None)
+
+    threading.Thread(target=run, name='grading-stream', daemon=True).start()
+
+    def generate():
+        completed = 0
+        yield format_event('progress', {'batch_id': batch_id, 'completed': 0, 'total': total}, stream_format)
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            event, data = item
+            yield format_event(event, data, stream_format)
+            if event == 'result':
+                completed += data['files']
+                yield format_event('progress', {'batch_id': batch_id, 'completed': completed, 'total': total}, stream_format)
+
+    # X-Accel-Buffering stops nginx/ngrok style proxies holding events back
+    return Response(generate(), mimetype=MIMETYPES[stream_format], headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,109 @@
+import json
+import re
+
+STRUCTURED_FORMAT_INSTRUCTIONS = """
+Respond with only a JSON object, no markdown and no other text, in exactly this shape:
+{"criteria": [{"name": "<criteria name>", "score": <points given>, "total": <points possible>, "comment": "<one short sentence>"}],
+ "feedback": "<2-3 sentences on how to improve>", "percentage": <total percentage grade 0-100>, "letter": "<letter grade, e.g. B+>"}
+"""
+
+LETTER_PATTERN = re.compile(r'^[A-F][+-]?$')
+FENCE_PATTERN = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def _number(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{field} must be a number')
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def load_json_response(output_text):
+    """
+    Decode a model response as JSON, tolerating a markdown code fence.
+    Raises ValueError if it isn't valid JSON
+    """
+    text = FENCE_PATTERN.sub('', output_text.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Response is not valid JSON: {str(e)}')
+
+
+def parse_structured_grade(output_text):
+    """
+    Parse and validate a structured grading response in one pass. Raises
+    ValueError if the JSON is malformed or doesn't match the schema
+    """
+    return validate_grade(load_json_response(output_text))
+
+
+def validate_grade(data):
+    """
+    Validate one decoded grade object and return it normalized. Raises
+    ValueError if it doesn't match the schema
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Response must be a JSON object')
+
+    criteria = data.get('criteria')
+    if not isinstance(criteria, list):
+        raise ValueError('criteria must be a list')
+
+    grade = {'criteria': [validate_criterion(item) for item in criteria]}
+    grade['percentage'], grade['letter'] = validate_overall(data)
+    grade['feedback'] = str(data.get('feedback') or '').strip()
+    return grade
+
+
+def validate_overall(data):
+    """
+    Validate the overall percentage and letter grade of a decoded grade
+    object. Returns (percentage, letter); raises ValueError if either is
+    missing or invalid
+    """
+    percentage = _number(data.get('percentage'), 'percentage')
+    if not 0 <= percentage <= 100:
+        raise ValueError('percentage must be between 0 and 100')
+    letter = str(data.get('letter') or '').strip().upper()
+    if not LETTER_PATTERN.match(letter):
+        raise ValueError(f'invalid letter grade: {letter}')
+    return percentage, letter
+
+
+def validate_criterion(item):
+    """
+    Validate one decoded criteria grade and return it normalized. Raises
+    ValueError if it doesn't match the schema
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name'].strip():
+        raise ValueError('each criteria needs a name')
+    score = _number(item.get('score'), 'score')
+    total = _number(item.get('total'), 'total')
+    if total < 0 or score < 0 or score > total:
+        raise ValueError(f"score for {item['name']} is out of range")
+    return {
+        'name': item['name'].strip(),
+        'score': score,
+        'total': total,
+        'comment': str(item.get('comment') or '').strip()
+    }
+
+
+def render_grade(grade):
+    """
+    Render a parsed grade as the same prose the free-text mode produces, so
+    existing clients can keep displaying and parsing it
+    """
+    lines = []
+    for item in grade['criteria']:
+        lines.append(f"• {item['name']}: {item['score']}/{item['total']}")
+        if item['comment']:
+            lines.append(f"  {item['comment']}")
+    lines.append("")
+    lines.append(f"Total Percentage Grade: {grade['percentage']}%")
+    lines.append(f"Letter Grade: {grade['letter']}")
+    if grade['feedback']:
+        lines.append("")
+        lines.append("Feedback:")
+        lines.append(grade['feedback'])
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+import re
+import threading
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+PARAGRAPH_PATTERN = re.compile(r"(?<=\n\n)")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    """
+    Count tokens locally, close to Gemini's SentencePiece tokenizer for
+    English prose: a token per short word, digit and punctuation mark, and
+    an extra token for every further 8 letters of a long word
+    """
+    return sum(1 + (len(token) - 1) // 8 for token in TOKEN_PATTERN.findall(text))
+
+
+def _units(text, max_tokens):
+    # Paragraphs, then sentences, then runs of words, each within max_tokens
+    for paragraph in PARAGRAPH_PATTERN.split(text):
+        if count_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in SENTENCE_PATTERN.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                yield sentence + " "
+                continue
+            words = []
+            words_tokens = 0
+            for word in sentence.split():
+                tokens = count_tokens(word)
+                if words and words_tokens + tokens > max_tokens:
+                    yield " ".join(words) + " "
+                    words, words_tokens = [], 0
+                words.append(word)
+                words_tokens += tokens
+            if words:
+                yield " ".join(words) + " "
+
+
+def split_by_tokens(text, max_tokens):
+    """
+    Split text into consecutive chunks of at most max_tokens tokens, on
+    paragraph or sentence boundaries where possible and without overlap
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in _units(text, max_tokens):
+        tokens = count_tokens(unit)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current).strip())
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+class TokenUsage:
+    """
+    Tally of the essay tokens sent for one batch, against what the old
+    overlapping 10k/1k character chunks would have sent
+    """
+
+    def __init__(self):
+        self.essays = 0
+        self.tokens_sent = 0
+        self.baseline_tokens = 0
+        self.map_reduce = 0
+        self._lock = threading.Lock()
+
+    def add(self, tokens_sent, baseline_tokens, map_reduce=False):
+        with self._lock:
+            self.essays += 1
+            self.tokens_sent += tokens_sent
+            self.baseline_tokens += baseline_tokens
+            self.map_reduce += int(map_reduce)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'essays': self.essays,
+                'tokens_sent': self.tokens_sent,
+                'baseline_tokens': self.baseline_tokens,
+                'tokens_saved': self.baseline_tokens - self.tokens_sent,
+                'map_reduce': self.map_reduce,
+            }
@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+
+from flask import Request
+
+CHUNK_SIZE = 256 * 1024
+
+
+class Upload:
+    """
+    One uploaded file, held as bytes when it is at most max_memory bytes
+    and spilled to a temporary file above that. source is what the PDF
+    extractor and image normalizer take: the bytes, or the spilled file's
+    path, both of which pickle cheaply to worker processes.
+    """
+
+    def __init__(self, name, data=None, path=None):
+        self.name = name
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def from_storage(cls, storage, max_memory):
+        """
+        Copy an uploaded file out of the request, then close its stream so
+        the request's buffer of it is freed rather than kept alongside the
+        copy until the request ends
+        """
+        stream = storage.stream
+        try:
+            stream.seek(0)
+            head = stream.read(max_memory + 1)
+            if len(head) <= max_memory:
+                return cls(storage.filename, data=head)
+
+            with tempfile.NamedTemporaryFile(delete=False) as spill:
+                try:
+                    spill.write(head)
+                    shutil.copyfileobj(stream, spill, CHUNK_SIZE)
+                except Exception:
+                    os.unlink(spill.name)
+                    raise
+            return cls(storage.filename, path=spill.name)
+        finally:
+            stream.close()
+
+    @property
+    def source(self):
+        return self.data if self.data is not None else self.path
+
+    @property
+    def size(self):
+        return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        self.data = None
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+class Uploads(list):
+    """
+    The Uploads of one request, closed together however it ends: use it
+    as a context manager or call close() from the code that finishes last.
+    Each file is kept in memory if it is at most max_memory bytes and the
+    request's files held in memory stay within max_total bytes; the rest
+    are spilled to disk
+    """
+
+    def __init__(self, max_memory, max_total=None):
+        super().__init__()
+        self.max_memory = max_memory
+        self.max_total = max_total
+
+    @property
+    def memory_bytes(self):
+        return sum(len(upload.data) for upload in self if upload.data is not None)
+
+    def add(self, storage):
+        max_memory = self.max_memory
+        if self.max_total is not None:
+            max_memory = max(0, min(max_memory, self.max_total - self.memory_bytes))
+        upload = Upload.from_storage(storage, max_memory)
+        self.append(upload)
+        return upload
+
+    def close(self):
+        for upload in self:
+            upload.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def source_of(file):
+    # Submissions are Uploads or, for downloaded files, plain paths
+    return file.source if isinstance(file, Upload) else file
+
+
+def name_of(file):
+    return file.name if isinstance(file, Upload) else file
+
+
+def read_file(file):
+    if isinstance(file, Upload):
+        return file.read()
+    with open(file, 'rb') as f:
+        return f.read()
+
+
+class _CountingSpool(tempfile.SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile that knows how many bytes it holds in memory:
+    what has been written until it rolls over to disk or is closed
+    """
+
+    def __init__(self, max_size):
+        super().__init__(max_size=max_size, mode='rb+')
+        self.held = 0
+
+    def write(self, data):
+        written = super().write(data)
+        self.held = 0 if self._rolled else self.held + written
+        return written
+
+    def close(self):
+        self.held = 0
+        super().close()
+
+
+def spooled_request_class(max_memory, max_total=None):
+    """
+    Flask request class buffering each uploaded file in memory up to
+    max_memory bytes, instead of Werkzeug's 500KB, before it goes to disk.
+    With max_total, a file only gets what is left of max_total bytes after
+    the files before it that are still in memory, so a request with many
+    files can't hold them all in RAM
+    """
+    class SpooledRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            if max_total is None:
+                return tempfile.SpooledTemporaryFile(max_size=max_memory, mode='rb+')
+            spools = self.__dict__.setdefault('_upload_spools', [])
+            size = min(max_memory, max_total - sum(spool.held for spool in spools))
+            if size <= 0:
+                # A max_size of 0 would never roll over
+                return tempfile.TemporaryFile(mode='rb+')
+            spool = _CountingSpool(size)
+            spools.append(spool)
+            return spool
+    return SpooledRequest
@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Scalar quantized indexes store 1 or 0.5 bytes per dimension instead of 4
+QUANTIZERS = {
+    'sq8': 'QT_8bit',
+    'sq4': 'QT_4bit',
+}
+
+
+def load_dependencies():
+    """
+    Import FAISS and the LangChain vector store, which are only needed
+    once something is indexed
+    """
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return faiss, np, InMemoryDocstore, FAISS, GoogleGenerativeAIEmbeddings
+
+
+class VectorIndexer:
+    """
+    Builds one persistent FAISS index per assignment off the grading path.
+
+    Submissions are queued to a single background thread that embeds their
+    chunks and appends them to the assignment's index instead of rebuilding
+    it from scratch. Changed indexes are saved once the queue drains, or
+    every save_every submissions while it doesn't, rather than after each
+    one, and at most max_open indexes are kept in memory.
+
+    index_type is 'flat' (exact, float32) or one of the memory-compact
+    'sq8' / 'sq4' scalar quantized indexes. A quantizer trained on a
+    handful of vectors maps everything to the same few points, so a
+    quantized index starts out flat and is converted, trained on
+    everything in it, once it holds train_size vectors.
+    """
+
+    def __init__(self, directory, enabled=False, index_type='flat', model="models/embedding-001",
+                 train_size=256, save_every=50, max_open=8):
+        if index_type != 'flat' and index_type not in QUANTIZERS:
+            raise ValueError(f'Unknown vector index type: {index_type}')
+        self.directory = directory
+        self.enabled = enabled
+        self.index_type = index_type
+        self.model = model
+        self.train_size = train_size
+        self.save_every = save_every
+        self.max_open = max_open
+        self._embeddings = None
+        # Only touched on the indexing thread
+        self._stores = OrderedDict()
+        self._dirty = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vector-index') if enabled else None
+
+    def _path(self, assignment_id):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', assignment_id))
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            GoogleGenerativeAIEmbeddings = load_dependencies()[4]
+            self._embeddings = GoogleGenerativeAIEmbeddings(model=self.model)
+        return self._embeddings
+
+    def _new_store(self, dimension):
+        faiss, _, InMemoryDocstore, FAISS, _ = load_dependencies()
+        return FAISS(
+            embedding_function=self._get_embeddings(),
+            index=faiss.IndexFlatL2(dimension),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+
+    def _quantize(self, store):
+        """
+        Swap a flat index holding train_size vectors or more for the
+        quantized type, trained on and filled with the same vectors in the
+        same order, so the docstore ids still line up
+        """
+        faiss = load_dependencies()[0]
+        index = store.index
+        if self.index_type == 'flat' or isinstance(index, faiss.IndexScalarQuantizer) \
+                or index.ntotal < self.train_size:
+            return
+        vectors = index.reconstruct_n(0, index.ntotal)
+        quantizer = getattr(faiss.ScalarQuantizer, QUANTIZERS[self.index_type])
+        quantized = faiss.IndexScalarQuantizer(index.d, quantizer, faiss.METRIC_L2)
+        quantized.train(vectors)
+        quantized.add(vectors)
+        store.index = quantized
+
+    def _open(self, assignment_id, store):
+        self._stores[assignment_id] = store
+        self._stores.move_to_end(assignment_id)
+        while len(self._stores) > self.max_open:
+            evicted, evicted_store = self._stores.popitem(last=False)
+            if self._dirty.pop(evicted, None):
+                self._save(evicted, evicted_store)
+
+    def _save(self, assignment_id, store):
+        store.save_local(self._path(assignment_id))
+
+    def flush(self):
+        """
+        Save every index changed since it was last saved
+        """
+        for assignment_id in list(self._dirty):
+            del self._dirty[assignment_id]
+            self._save(assignment_id, self._stores[assignment_id])
+
+    def get_store(self, assignment_id):
+        """
+        Return the assignment's index, loading it from disk if needed, or
+        None if nothing has been indexed for it yet
+        """
+        if assignment_id in self._stores:
+            self._stores.move_to_end(assignment_id)
+            return self._stores[assignment_id]
+        path = self._path(assignment_id)
+        if not os.path.exists(os.path.join(path, 'index.faiss')):
+            return None
+        FAISS = load_dependencies()[3]
+        store = FAISS.load_local(path, self._get_embeddings(), allow_dangerous_deserialization=True)
+        self._open(assignment_id, store)
+        return store
+
+    def submit(self, assignment_id, text_chunks, metadatas=None):
+        """
+        Queue chunks to be appended to the assignment's index. Returns the
+        future, or None when indexing is disabled
+        """
+        if not self.enabled or not text_chunks:
+            return None
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._add, assignment_id, list(text_chunks), metadatas)
+
+    def _add(self, assignment_id, text_chunks, metadatas):
+        try:
+            vectors = self._get_embeddings().embed_documents(text_chunks)
+            store = self.get_store(assignment_id)
+            if store is None:
+                store = self._new_store(len(vectors[0]))
+                self._open(assignment_id, store)
+            store.add_embeddings(zip(text_chunks, vectors), metadatas=metadatas)
+            self._quantize(store)
+            self._dirty[assignment_id] = self._dirty.get(assignment_id, 0) + 1
+            if self._dirty[assignment_id] >= self.save_every:
+                del self._dirty[assignment_id]
+                self._save(assignment_id, store)
+        except Exception as e:
+            print(f"Error indexing submission for {assignment_id}: {str(e)}")
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+                drained = self._pending == 0
+            if drained:
+                self.flush()